@@ -0,0 +1,54 @@
+"""
+Memory used by open_digraph graphs, in bytes per node and per edge.
+
+    python -m benchmarks.memory [--sizes 1000 10000] [--bound 2] [--form DAG] [--degree 4]
+
+Graphs come from open_digraph.random in sparse mode, with a density chosen so
+that each node has about `degree` neighbours; only the memory still allocated
+once the graph is built is counted.
+"""
+import argparse
+import gc
+import tracemalloc
+
+from modules.open_digraph import open_digraph
+
+
+def measure(n, bound, form, degree, seed=0):
+    """
+    Returns (nodes, edges, edges with multiplicity, bytes) for a random graph of size n
+    """
+    # A small graph of the same shape first, so that the one-time allocations (numpy
+    # generators, compiled regexes, ...) are not counted in the first measure
+    open_digraph.random(100, bound, form=form, density=min(1, degree / 100), seed=seed)
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    graph = open_digraph.random(n, bound, form=form, density=min(1, degree / n), seed=seed)
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    edges = sum(len(n.children) for n in graph.nodes.values())
+    edges_mult = sum(sum(n.children.values()) for n in graph.nodes.values())
+    return len(graph.nodes), edges, edges_mult, used
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10**3, 10**4, 10**5, 10**6])
+    parser.add_argument('--bound', type=int, default=2)
+    parser.add_argument('--form', default='DAG')
+    parser.add_argument('--degree', type=float, default=4)
+    args = parser.parse_args(argv)
+
+    print(f"{'nodes':>10} {'edges':>12} {'edges (mult)':>14} {'MiB':>10} {'B/node':>10} {'B/edge':>10}")
+    for n in args.sizes:
+        nodes, edges, edges_mult, used = measure(n, args.bound, args.form, args.degree)
+        per_edge = used / edges if edges else float('nan')
+        print(f"{nodes:>10} {edges:>12} {edges_mult:>14} {used / 2**20:>10.1f} "
+              f"{used / nodes:>10.1f} {per_edge:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
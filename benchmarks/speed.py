@@ -0,0 +1,196 @@
+"""
+Time taken by the open_digraph hot paths, compared with a stored baseline.
+
+    python -m benchmarks.speed [--sizes 100 1000] [--repeat 5] [--output results.json]
+                               [--baseline benchmarks/baseline.json] [--tolerance 0.25]
+                               [--save-baseline]
+
+Each case is run on graphs from open_digraph.random (sparse DAGs with about
+`degree` neighbours per node, same seed every run) and the best time of `repeat`
+runs is kept; building the graph is not timed. Results are written as JSON. With
+a baseline, the cases more than `tolerance` slower than it are reported and the
+exit status is 1. Timings depend on the machine: the stored baseline is only
+meaningful where it was saved, run with --save-baseline to make a local one.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+from modules.open_digraph import open_digraph, graph_from_adjacency_matrix
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+
+def random_graph(n, degree, seed):
+    return open_digraph.random(n, 2, inputs=max(1, n // 20), outputs=max(1, n // 20),
+                               form="DAG", density=min(1, degree / n), seed=seed)
+
+
+# Each case takes (graph, rng, tmp) and returns (prepare, fn): fn is timed, called with
+# the result of prepare (not timed, run before each call) or with nothing if prepare is
+# None. Cases that modify the graph prepare a copy of it.
+
+def add_node_case(graph, rng, tmp):
+    ids = list(graph.nodes)
+    parents = [{rng.choice(ids): 1} for _ in ids]
+    return graph.copy, lambda g: [g.add_node('&', p) for p in parents]
+
+
+def add_edge_case(graph, rng, tmp):
+    ids = list(graph.nodes)
+    edges = [(rng.choice(ids), rng.choice(ids)) for _ in ids]
+    return graph.copy, lambda g: [g.add_edge(src, tgt) for src, tgt in edges]
+
+
+def remove_node_by_id_case(graph, rng, tmp):
+    ids = rng.sample(list(graph.nodes), len(graph.nodes) // 10)
+    return graph.copy, lambda g: [g.remove_node_by_id(node_id) for node_id in ids]
+
+
+def is_well_formed_case(graph, rng, tmp):
+    return None, graph.is_well_formed
+
+
+def adjacency_matrix_case(graph, rng, tmp):
+    return None, graph.adjacency_matrix
+
+
+def graph_from_adjacency_matrix_case(graph, rng, tmp):
+    m = graph.adjacency_matrix()
+    return None, lambda: graph_from_adjacency_matrix(m)
+
+
+def from_dot_file_case(graph, rng, tmp):
+    path = os.path.join(tmp, 'read.dot')
+    graph.save_as_dot_file(path)
+    return None, lambda: open_digraph.from_dot_file(path)
+
+
+def save_as_dot_file_case(graph, rng, tmp):
+    path = os.path.join(tmp, 'write.dot')
+    return None, lambda: graph.save_as_dot_file(path)
+
+
+def copy_case(graph, rng, tmp):
+    return None, graph.copy
+
+
+def snapshot_case(graph, rng, tmp):
+    # A snapshot and a few changes, as in rewrite loops
+    ids = list(graph.nodes)
+    edges = [(rng.choice(ids), rng.choice(ids)) for _ in range(10)]
+    def run():
+        s = graph.snapshot()
+        for src, tgt in edges:
+            s.add_edge(src, tgt)
+    return None, run
+
+
+def snapshot_loop_case(graph, rng, tmp):
+    # Snapshot, try a change and discard it, then change the original, as in search loops
+    ids = list(graph.nodes)
+    edges = [(rng.choice(ids), rng.choice(ids)) for _ in range(10)]
+    def run(g):
+        for src, tgt in edges:
+            s = g.snapshot()
+            s.add_edge(src, tgt)
+            g.add_edge(tgt, src)
+    return graph.copy, run
+
+
+CASES = {
+    'add_node': add_node_case,
+    'add_edge': add_edge_case,
+    'remove_node_by_id': remove_node_by_id_case,
+    'is_well_formed': is_well_formed_case,
+    'adjacency_matrix': adjacency_matrix_case,
+    'graph_from_adjacency_matrix': graph_from_adjacency_matrix_case,
+    'from_dot_file': from_dot_file_case,
+    'save_as_dot_file': save_as_dot_file_case,
+    'copy': copy_case,
+    'snapshot': snapshot_case,
+    'snapshot_loop': snapshot_loop_case,
+}
+
+
+def run(cases, sizes, repeat=5, degree=4, seed=0):
+    """
+    Returns {case: {size: best time in seconds}}, sizes as strings (JSON keys)
+    """
+    results = {name: {} for name in cases}
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in sizes:
+            graph = random_graph(n, degree, seed)
+            for name in cases:
+                prepare, fn = CASES[name](graph, random.Random(seed), tmp)
+                best = float('inf')
+                for _ in range(repeat):
+                    args = () if prepare is None else (prepare(),)
+                    start = time.perf_counter()
+                    fn(*args)
+                    best = min(best, time.perf_counter() - start)
+                results[name][str(n)] = best
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Returns the (case, size, time, baseline time) where time > baseline time * (1 + tolerance)
+    """
+    slower = []
+    for name, times in results.items():
+        for size, t in times.items():
+            base = baseline.get(name, {}).get(size)
+            if base is not None and t > base * (1 + tolerance):
+                slower.append((name, size, t, base))
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 3000])
+    parser.add_argument('--cases', nargs='+', default=list(CASES), choices=list(CASES))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--degree', type=float, default=4)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="JSON file for the results")
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--save-baseline', action='store_true',
+                        help="write the results as the new baseline instead of comparing")
+    args = parser.parse_args(argv)
+
+    results = run(args.cases, args.sizes, args.repeat, args.degree, args.seed)
+    report = {'python': platform.python_version(), 'machine': platform.machine(),
+              'sizes': args.sizes, 'degree': args.degree, 'seed': args.seed, 'results': results}
+
+    print(f"{'case':<28}" + ''.join(f"{n:>12}" for n in args.sizes))
+    for name, times in results.items():
+        print(f"{name:<28}" + ''.join(f"{times[str(n)] * 1000:>10.2f}ms" for n in args.sizes))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        return 0
+    if not os.path.exists(args.baseline):
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)['results']
+    slower = compare(results, baseline, args.tolerance)
+    for name, size, t, base in slower:
+        print(f"Regression: {name} on {size} nodes takes {t * 1000:.2f}ms, "
+              f"baseline {base * 1000:.2f}ms ({t / base - 1:+.0%})")
+    return 1 if slower else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
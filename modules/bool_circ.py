@@ -0,0 +1,371 @@
+from functools import reduce
+import operator
+import time
+
+from modules.open_digraph import np
+
+# Gates, by node label. The value of a node is computed from the values of its parents;
+# a parent with multiplicity k counts k times (it only matters for '^').
+COPY = ''
+AND = '&'
+OR = '|'
+XOR = '^'
+NOT = '~'
+ZERO = '0'
+ONE = '1'
+
+_OP_INPUT, _OP_COPY, _OP_AND, _OP_OR, _OP_XOR, _OP_NOT, _OP_ZERO, _OP_ONE = range(8)
+
+_OPCODES = {COPY: _OP_COPY, AND: _OP_AND, OR: _OP_OR, XOR: _OP_XOR,
+            NOT: _OP_NOT, ZERO: _OP_ZERO, ONE: _OP_ONE}
+
+
+class compiled_circuit: # boolean circuit turned into a flat instruction list
+
+    def __init__(self, instructions, size, input_slots, output_slots):
+        '''
+        instructions: (opcode, slot, source slots) list; in topological order
+        size: int; number of value slots, one per node
+        input_slots: int list; slot of each input, in the order of graph.inputs
+        output_slots: int list; slot of each output, in the order of graph.outputs
+        '''
+        self.instructions = instructions
+        self.size = size
+        self.input_slots = input_slots
+        self.output_slots = output_slots
+
+    @classmethod
+    def compile(cls, graph):
+        """
+        Orders the nodes of a well formed, acyclic open_digraph once and turns each of
+        them into an instruction. Input nodes take the values given to evaluate, the
+        other nodes are gates named by their label (see the constants of this module).
+        Raises a ValueError for a malformed or cyclic graph, an unknown label or a
+        '~' or copy node without exactly one parent.
+        """
+        graph.assert_is_well_formed()
+        order = [node_id for layer in graph.topological_sort() for node_id in layer]
+        slots = {node_id: i for i, node_id in enumerate(order)}
+        input_ids = set(graph.inputs)
+
+        instructions = []
+        for node_id in order:
+            n = graph.nodes[node_id]
+            if node_id in input_ids:
+                instructions.append((_OP_INPUT, slots[node_id], ()))
+                continue
+            if n.label not in _OPCODES:
+                raise ValueError(f"Unknown gate {n.label!r} at node {node_id}")
+            opcode = _OPCODES[n.label]
+            sources = tuple(slots[p] for p, m in n.parents.items() for _ in range(m))
+            if opcode in (_OP_COPY, _OP_NOT) and len(sources) != 1:
+                raise ValueError(f"Node {node_id} ({n.label!r}) has {len(sources)} parents instead of 1")
+            if opcode == _OP_XOR:
+                # x ^ x = 0: only the parity of the multiplicity matters
+                sources = tuple(slots[p] for p, m in n.parents.items() if m % 2)
+            elif opcode in (_OP_AND, _OP_OR):
+                # x & x = x and x | x = x
+                sources = tuple(slots[p] for p in n.parents)
+            instructions.append((opcode, slots[node_id], sources))
+
+        return cls(instructions, len(order),
+                   [slots[i] for i in graph.inputs], [slots[o] for o in graph.outputs])
+
+    def evaluate_batch(self, words, width=64):
+        """
+        Evaluates the circuit on many input vectors at once, one bit per vector.
+        words: one word per input, bit k of words[i] being the value of input i in vector k.
+               Python ints (any width), or numpy uint64 arrays of the same shape.
+        width: number of vectors packed in the int words (ignored for numpy arrays)
+        Returns the output words, in the same form.
+        """
+        if len(words) != len(self.input_slots):
+            raise ValueError(f"{len(words)} input words for {len(self.input_slots)} inputs")
+        if np is not None and isinstance(words[0] if words else None, np.ndarray):
+            ones = np.full(np.shape(words[0]), np.uint64(2**64 - 1), dtype=np.uint64)
+            invert = np.invert
+        else:
+            ones = (1 << width) - 1
+            invert = lambda v: v ^ ones
+        zero = ones ^ ones
+
+        values = [None] * self.size
+        for slot, word in zip(self.input_slots, words):
+            values[slot] = word
+
+        for opcode, slot, sources in self.instructions:
+            if opcode == _OP_COPY:
+                values[slot] = values[sources[0]]
+            elif opcode == _OP_AND:
+                values[slot] = reduce(operator.and_, (values[s] for s in sources), ones)
+            elif opcode == _OP_OR:
+                values[slot] = reduce(operator.or_, (values[s] for s in sources), zero)
+            elif opcode == _OP_XOR:
+                values[slot] = reduce(operator.xor, (values[s] for s in sources), zero)
+            elif opcode == _OP_NOT:
+                values[slot] = invert(values[sources[0]])
+            elif opcode == _OP_ZERO:
+                values[slot] = zero
+            elif opcode == _OP_ONE:
+                values[slot] = ones
+        return [values[slot] for slot in self.output_slots]
+
+    def evaluate(self, inputs):
+        """
+        Evaluates the circuit on a single vector of booleans, returns the outputs as booleans
+        """
+        return [bool(word) for word in self.evaluate_batch([int(bool(b)) for b in inputs], 1)]
+
+    def truth_table(self):
+        """
+        Evaluates the circuit on all the 2^n input vectors at once.
+        Returns one int per output whose bit k is the output for the vector where
+        input i is bit i of k.
+        """
+        n = len(self.input_slots)
+        return self.evaluate_batch([exhaustive_word(i, n) for i in range(n)], 1 << n)
+
+
+def exhaustive_word(i, n):
+    """
+    Word of 2^n bits whose bit k is bit i of k: the values of variable i over all
+    the assignments of n variables
+    """
+    if i < 3:
+        # Patterns inside a byte: 0b10101010, 0b11001100, 0b11110000
+        pattern = bytes([(0xAA, 0xCC, 0xF0)[i]])
+    else:
+        half = 1 << (i - 3)
+        pattern = bytes(half) + b'\xff' * half
+    size = max(1, (1 << n) // 8)
+    word = int.from_bytes(pattern * (size // len(pattern)), 'little')
+    return word & ((1 << (1 << n)) - 1)
+
+
+################# REWRITING ##########################
+# Each rule looks at one node of the graph and rewrites the circuit around it with the
+# graph primitives (add_edge, remove_*, add_node, set_node_label). It returns the ids
+# of the nodes whose parents or children changed, or None if it did nothing.
+# protected: ids of the inputs and outputs, which are never rewritten nor removed.
+
+_CONSTANTS = (ZERO, ONE)
+
+
+def _move_children(graph, src, dst):
+    """
+    Gives all the children of src to dst, returns their ids
+    """
+    children = list(graph.nodes[src].children.items())
+    for child_id, multiplicity in children:
+        graph.remove_parallel_edges(src, child_id)
+        for _ in range(multiplicity):
+            graph.add_edge(dst, child_id)
+    return {child_id for child_id, _ in children}
+
+
+def _negate(graph, node_id):
+    """
+    Puts a '~' between node_id and its children
+    """
+    new_id = graph.add_node(NOT)
+    touched = _move_children(graph, node_id, new_id)
+    graph.add_edge(node_id, new_id)
+    return touched | {new_id}
+
+
+def constant_propagation(graph, node_id, protected):
+    """
+    Folds the constant parents of a gate: '0'/'1' absorb or vanish in '&', '|' and '^',
+    '~' and copies of a constant become constants, gates without parents become their
+    neutral element.
+    """
+    if node_id in protected:
+        return None
+    n = graph.nodes[node_id]
+    constants = [p for p in n.parents
+                 if graph.nodes[p].label in _CONSTANTS and p not in protected]
+    label = n.label
+    if not constants and (n.parents or label not in (AND, OR, XOR)):
+        return None
+
+    touched = {node_id, *constants, *n.children}
+    values = {p: (graph.nodes[p].label == ONE, n.parents[p]) for p in constants}
+    if label in (COPY, NOT):
+        if label == COPY:
+            value = values[constants[0]][0]
+        else:
+            value = not values[constants[0]][0]
+        graph.remove_parallel_edges(constants[0], node_id)
+        graph.set_node_label(node_id, ONE if value else ZERO)
+    elif label in (AND, OR):
+        # 0 absorbs '&' and 1 absorbs '|', the other constant is neutral
+        absorbing = label == OR
+        if any(value == absorbing for value, _ in values.values()):
+            if any(p in protected for p in n.parents):
+                # An input must keep its child: the children of the gate go to a new constant
+                new_id = graph.add_node(ONE if absorbing else ZERO)
+                return touched | _move_children(graph, node_id, new_id) | {new_id}
+            touched.update(n.parents)
+            for p in list(n.parents):
+                graph.remove_parallel_edges(p, node_id)
+            graph.set_node_label(node_id, ONE if absorbing else ZERO)
+        else:
+            for p in constants:
+                graph.remove_parallel_edges(p, node_id)
+            if not graph.nodes[node_id].parents:
+                graph.set_node_label(node_id, ZERO if absorbing else ONE)
+    elif label == XOR:
+        parity = sum(m for value, m in values.values() if value) % 2
+        for p in constants:
+            graph.remove_parallel_edges(p, node_id)
+        if not graph.nodes[node_id].parents:
+            graph.set_node_label(node_id, ONE if parity else ZERO)
+        elif parity:
+            touched |= _negate(graph, node_id)
+    else:
+        # Constants only feed copies and gates
+        return None
+    return touched
+
+
+def double_negation(graph, node_id, protected):
+    """
+    ~~x becomes x
+    """
+    n = graph.nodes[node_id]
+    if node_id in protected or n.label != NOT or len(n.parents) != 1:
+        return None
+    [parent_id] = n.parents
+    parent = graph.nodes[parent_id]
+    if parent_id in protected or parent.label != NOT or len(parent.parents) != 1:
+        return None
+    [source_id] = parent.parents
+
+    if parent.children == {node_id: 1}:
+        # The first '~' only feeds this one: both become a single copy of x
+        touched = _move_children(graph, node_id, parent_id)
+        graph.remove_node_by_id(node_id)
+        graph.set_node_label(parent_id, COPY)
+        return touched | {parent_id}
+    if source_id in graph.inputs:
+        # An input keeps a single child
+        return None
+    touched = _move_children(graph, node_id, source_id)
+    graph.remove_node_by_id(node_id)
+    return touched | {source_id, parent_id}
+
+
+def copy_fusion(graph, node_id, protected):
+    """
+    A copy of a copy is merged into it
+    """
+    n = graph.nodes[node_id]
+    if node_id in protected or n.label != COPY or len(n.parents) != 1:
+        return None
+    [parent_id] = n.parents
+    if parent_id in protected or graph.nodes[parent_id].label != COPY:
+        return None
+    touched = _move_children(graph, node_id, parent_id)
+    graph.remove_node_by_id(node_id)
+    return touched | {parent_id}
+
+
+def idempotent_gates(graph, node_id, protected):
+    """
+    x & x = x, x | x = x, x ^ x = 0; a gate left with a single parent becomes a copy
+    """
+    n = graph.nodes[node_id]
+    if node_id in protected or n.label not in (AND, OR, XOR):
+        return None
+    touched = set()
+    for parent_id, multiplicity in list(n.parents.items()):
+        extra = multiplicity - 1 if n.label != XOR else multiplicity - multiplicity % 2
+        for _ in range(extra):
+            graph.remove_edge(parent_id, node_id)
+        if extra:
+            touched.add(parent_id)
+    n = graph.nodes[node_id]
+    if len(n.parents) == 1 and next(iter(n.parents.values())) == 1:
+        graph.set_node_label(node_id, COPY)
+        touched.add(node_id)
+    if not touched:
+        return None
+    return touched | {node_id, *n.children}
+
+
+def duplicate_gates(graph, node_id, protected):
+    """
+    Gates with the same label and the same parents are merged
+    """
+    n = graph.nodes[node_id]
+    if node_id in protected or not n.parents or n.label not in _OPCODES:
+        return None
+    first_parent = next(iter(n.parents))
+    for other_id in list(graph.nodes[first_parent].children):
+        other = graph.nodes[other_id]
+        if other_id != node_id and other_id not in protected \
+                and other.label == n.label and other.parents == n.parents:
+            touched = _move_children(graph, other_id, node_id)
+            graph.remove_node_by_id(other_id)
+            return touched | {node_id, *n.parents}
+    return None
+
+
+def dead_gates(graph, node_id, protected):
+    """
+    A node that is not an output and has no children is removed,
+    unless it is the child of an input
+    """
+    n = graph.nodes[node_id]
+    if node_id in protected or n.children or any(p in protected for p in n.parents):
+        return None
+    touched = set(n.parents)
+    graph.remove_node_by_id(node_id)
+    return touched
+
+
+DEFAULT_PASSES = [constant_propagation, double_negation, copy_fusion,
+                  idempotent_gates, duplicate_gates, dead_gates]
+
+
+class pass_manager: # runs rewriting rules until nothing changes
+
+    def __init__(self, passes=None):
+        '''
+        passes: rule list; see DEFAULT_PASSES
+        '''
+        self.passes = list(DEFAULT_PASSES if passes is None else passes)
+
+    def run(self, graph):
+        """
+        Applies the passes, in order, to a worklist holding at first every node, then
+        only the nodes touched by the previous round, until the worklist is empty.
+        Returns one dict per pass: its name, number of rewrites, time spent (seconds)
+        and change in the number of nodes.
+        """
+        protected = set(graph.inputs) | set(graph.outputs)
+        stats = [{'pass': p.__name__, 'rewrites': 0, 'time': 0.0, 'nodes': 0} for p in self.passes]
+        worklist = dict.fromkeys(graph.nodes) # ordered set
+        while worklist:
+            touched = {}
+            for rule, stat in zip(self.passes, stats):
+                size = len(graph.nodes)
+                start = time.perf_counter()
+                for node_id in worklist:
+                    # Nodes may have been removed by an earlier rewrite
+                    if node_id in graph.nodes:
+                        changed = rule(graph, node_id, protected)
+                        if changed:
+                            stat['rewrites'] += 1
+                            touched.update(dict.fromkeys(changed))
+                stat['time'] += time.perf_counter() - start
+                stat['nodes'] += len(graph.nodes) - size
+            worklist = {node_id: None for node_id in touched if node_id in graph.nodes}
+        return stats
+
+
+def simplify(graph, passes=None):
+    """
+    Simplifies a boolean circuit in place, see pass_manager.run
+    """
+    return pass_manager(passes).run(graph)
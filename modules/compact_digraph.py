@@ -0,0 +1,354 @@
+from array import array
+from bisect import bisect_left
+from collections import deque
+import mmap
+import struct
+import sys
+
+from modules.open_digraph import node, open_digraph
+
+
+class compact_digraph: # read-only, array backed open directed graph
+
+    def __init__(self, ids, labels, fwd, bwd, inputs, outputs):
+        '''
+        ids: int array; node id of each index (0 to n-1)
+        labels: string sequence; label of each index
+        fwd: (offsets, targets, multiplicities) arrays; children of each index (CSR),
+             the children of index i are targets[offsets[i]:offsets[i+1]], sorted
+        bwd: (offsets, targets, multiplicities) arrays; parents of each index (CSC)
+        inputs: int array; the indices of the input nodes
+        outputs: int array; the indices of the output nodes
+        '''
+        self.ids = ids
+        self.labels = labels
+        self.fwd = fwd
+        self.bwd = bwd
+        self.inputs = inputs
+        self.outputs = outputs
+        self.index = {identity: i for i, identity in enumerate(ids)} # node id -> index
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __reduce__(self):
+        # Pickled as plain arrays: memory mapped views are copied, the index is rebuilt
+        return (compact_digraph,
+                (_as_array('q', self.ids), list(self.labels),
+                 tuple(_as_array(t, a) for t, a in zip('qii', self.fwd)),
+                 tuple(_as_array(t, a) for t, a in zip('qii', self.bwd)),
+                 _as_array('i', self.inputs), _as_array('i', self.outputs)))
+
+    def __repr__(self):
+        return f"compact_digraph({len(self.ids)} nodes, {len(self.fwd[1])} edges)"
+
+    @classmethod
+    def from_open_digraph(cls, graph):
+        """
+        Packs an open_digraph into arrays. Raises a ValueError if an id is not an
+        integer or if an edge points to a node that is not in the graph.
+        """
+        index = graph.dic_nodes()
+        ids = array('q')
+        labels = []
+        for node_id, n in graph.nodes.items():
+            if not isinstance(node_id, int):
+                raise ValueError(f"{node_id} is not an integer id")
+            ids.append(node_id)
+            labels.append(n.label)
+        fwd = _pack([n.children for n in graph.nodes.values()], index)
+        bwd = _pack([n.parents for n in graph.nodes.values()], index)
+        inputs = array('i', _indices(graph.inputs, index))
+        outputs = array('i', _indices(graph.outputs, index))
+        return cls(ids, labels, fwd, bwd, inputs, outputs)
+
+    def save_binary(self, path, byteorder=sys.byteorder):
+        """
+        Writes the graph in the binary snapshot format (see _BINARY_HEADER).
+        byteorder: 'little' or 'big', the machine's by default (load_binary reads both)
+        """
+        if byteorder not in ('little', 'big'):
+            raise ValueError(f"Unknown byte order {byteorder}")
+        swap = byteorder != sys.byteorder
+        pool, label_offsets = _string_pool.pack(self.labels)
+        header = _BINARY_HEADER.pack(_BINARY_MAGIC, _BINARY_VERSION, byteorder == 'big',
+                                     len(self.ids), len(self.fwd[1]), len(self.bwd[1]),
+                                     len(self.inputs), len(self.outputs), len(pool))
+        with open(path, 'wb') as f:
+            f.write(header)
+            for section in (_as_array('q', self.ids), label_offsets, pool,
+                            *(_as_array(t, a) for t, a in zip('qii', self.fwd)),
+                            *(_as_array(t, a) for t, a in zip('qii', self.bwd)),
+                            _as_array('i', self.inputs), _as_array('i', self.outputs)):
+                if swap and isinstance(section, array):
+                    section = array(section.typecode, section)
+                    section.byteswap()
+                data = bytes(section)
+                f.write(data)
+                f.write(bytes(-len(data) % 8)) # Sections start on 8 bytes boundaries
+
+    @classmethod
+    def load_binary(cls, path, use_mmap=True):
+        """
+        Reads a graph written by save_binary. With use_mmap, the arrays are views
+        on the memory mapped file: loading does not read the edges, and labels are
+        decoded when asked for. Raises a ValueError if the file is not a snapshot.
+        """
+        with open(path, 'rb') as f:
+            if use_mmap:
+                buffer = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+            else:
+                buffer = memoryview(f.read())
+
+        if len(buffer) < _BINARY_HEADER.size:
+            raise ValueError(f"{path} is not an open_digraph snapshot")
+        magic, version, big_endian, n, e_fwd, e_bwd, n_in, n_out, pool_size = \
+            _BINARY_HEADER.unpack_from(buffer)
+        if magic != _BINARY_MAGIC:
+            raise ValueError(f"{path} is not an open_digraph snapshot")
+        if version != _BINARY_VERSION:
+            raise ValueError(f"Unsupported snapshot version {version}")
+        swap = big_endian != (sys.byteorder == 'big')
+
+        pos = _BINARY_HEADER.size
+        sections = []
+        for typecode, length in (('q', n), ('q', n + 1), ('B', pool_size),
+                                 ('q', n + 1), ('i', e_fwd), ('i', e_fwd),
+                                 ('q', n + 1), ('i', e_bwd), ('i', e_bwd),
+                                 ('i', n_in), ('i', n_out)):
+            size = length * struct.calcsize(typecode)
+            chunk = buffer[pos:pos + size]
+            if swap:
+                # Views can't be byte swapped, fall back to a copy
+                data = chunk
+                chunk = array(typecode)
+                chunk.frombytes(data)
+                chunk.byteswap()
+            else:
+                chunk = chunk.cast(typecode)
+            sections.append(chunk)
+            pos += size + (-size % 8)
+        ids, label_offsets, pool, *csr, inputs, outputs = sections
+        return cls(ids, _string_pool(pool, label_offsets), tuple(csr[:3]), tuple(csr[3:]),
+                   inputs, outputs)
+
+    def to_open_digraph(self):
+        """
+        Builds back the equivalent open_digraph
+        """
+        nodes = [node(self.ids[i], self.labels[i], self._row(self.bwd, i), self._row(self.fwd, i))
+                 for i in range(len(self.ids))]
+        return open_digraph([self.ids[i] for i in self.inputs],
+                            [self.ids[i] for i in self.outputs], nodes)
+
+    def _row(self, csr, i):
+        """
+        Returns the row i of csr as an id->multiplicity dict
+        """
+        offsets, targets, multiplicities = csr
+        ids = self.ids
+        return {ids[targets[k]]: multiplicities[k] for k in range(offsets[i], offsets[i + 1])}
+
+    #getters
+    def get_input_ids(self):
+        return [self.ids[i] for i in self.inputs]
+
+    def get_output_ids(self):
+        return [self.ids[i] for i in self.outputs]
+
+    def get_node_ids(self):
+        return list(self.ids)
+
+    def get_label(self, identity):
+        return self.labels[self.index[identity]]
+
+    def get_children(self, identity):
+        return self._row(self.fwd, self.index[identity])
+
+    def get_parents(self, identity):
+        return self._row(self.bwd, self.index[identity])
+
+    def get_node_by_id(self, identity):
+        """
+        Returns a node built on demand for this id, None if it is not in the graph
+        """
+        i = self.index.get(identity)
+        if i is None:
+            return None
+        return node(identity, self.labels[i], self._row(self.bwd, i), self._row(self.fwd, i))
+
+    def multiplicity(self, src, tgt):
+        """
+        Number of edges from src to tgt, found by binary search in the row of src
+        """
+        i = self.index[src]
+        j = self.index[tgt]
+        offsets, targets, multiplicities = self.fwd
+        k = bisect_left(targets, j, offsets[i], offsets[i + 1])
+        if k < offsets[i + 1] and targets[k] == j:
+            return multiplicities[k]
+        return 0
+
+    def adjacency_matrix(self):
+        """
+        Generates the adjacency matrix of the graph, in the same order as open_digraph.dic_nodes
+        """
+        size = len(self.ids)
+        m = [[0] * size for _ in range(size)]
+        offsets, targets, multiplicities = self.fwd
+        for i in range(size):
+            row = m[i]
+            for k in range(offsets[i], offsets[i + 1]):
+                row[targets[k]] = multiplicities[k]
+        return m
+
+    def is_well_formed(self):
+        """
+        Same conditions as open_digraph.is_well_formed
+        """
+        fwd_offsets, fwd_targets, fwd_mult = self.fwd
+        bwd_offsets, bwd_targets, bwd_mult = self.bwd
+
+        for i in self.outputs:
+            # A single parent with multiplicity 1 and no children
+            if bwd_offsets[i + 1] - bwd_offsets[i] != 1 or bwd_mult[bwd_offsets[i]] != 1:
+                return False
+            if fwd_offsets[i + 1] != fwd_offsets[i]:
+                return False
+
+        for i in self.inputs:
+            # A single child with multiplicity 1 and no parents
+            if fwd_offsets[i + 1] - fwd_offsets[i] != 1 or fwd_mult[fwd_offsets[i]] != 1:
+                return False
+            if bwd_offsets[i + 1] != bwd_offsets[i]:
+                return False
+
+        # Each edge has to be seen with the same multiplicity from both sides
+        if len(fwd_targets) != len(bwd_targets):
+            return False
+        for i in range(len(self.ids)):
+            for k in range(fwd_offsets[i], fwd_offsets[i + 1]):
+                j = fwd_targets[k]
+                lo, hi = bwd_offsets[j], bwd_offsets[j + 1]
+                p = bisect_left(bwd_targets, i, lo, hi)
+                if p == hi or bwd_targets[p] != i or bwd_mult[p] != fwd_mult[k]:
+                    return False
+        return True
+
+    def assert_is_well_formed(self):
+        """
+        Asserts if the graph is well formed, if not sends a ValueError
+        """
+        if not self.is_well_formed():
+            raise ValueError("The graph is not well_formed")
+
+    def _neighbours(self, i, direction):
+        """
+        Indices next to i: children if direction is 1, parents if -1, both if None
+        """
+        if direction != -1:
+            offsets, targets, _ = self.fwd
+            yield from targets[offsets[i]:offsets[i + 1]]
+        if direction != 1:
+            offsets, targets, _ = self.bwd
+            yield from targets[offsets[i]:offsets[i + 1]]
+
+    def iter_bfs(self, start, direction=1):
+        """
+        Yields the ids reachable from start, breadth first
+        direction: 1 to follow children, -1 to follow parents, None for both
+        """
+        seen = bytearray(len(self.ids))
+        i = self.index[start]
+        seen[i] = 1
+        queue = deque([i])
+        while queue:
+            i = queue.popleft()
+            yield self.ids[i]
+            for j in self._neighbours(i, direction):
+                if not seen[j]:
+                    seen[j] = 1
+                    queue.append(j)
+
+    def iter_dfs(self, start, direction=1):
+        """
+        Yields the ids reachable from start, depth first (preorder), without recursion
+        direction: 1 to follow children, -1 to follow parents, None for both
+        """
+        seen = bytearray(len(self.ids))
+        stack = [self.index[start]]
+        while stack:
+            i = stack.pop()
+            if seen[i]:
+                continue
+            seen[i] = 1
+            yield self.ids[i]
+            # Reversed so that the smallest neighbour is visited first
+            stack.extend(j for j in reversed(list(self._neighbours(i, direction))) if not seen[j])
+
+
+# Snapshot header: magic, version, big endian flag, number of nodes, forward and
+# backward edge entries, inputs, outputs and size of the label pool. It is followed by
+# the sections ids, label offsets, label pool, forward CSR (offsets, targets,
+# multiplicities), backward CSR, inputs and outputs, each padded to 8 bytes.
+_BINARY_HEADER = struct.Struct('<4sHH6q')
+_BINARY_MAGIC = b'ODGB'
+_BINARY_VERSION = 1
+
+
+class _string_pool: # read-only sequence of strings stored in one utf-8 buffer
+
+    def __init__(self, pool, offsets):
+        self.pool = pool
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return bytes(self.pool[self.offsets[i]:self.offsets[i + 1]]).decode()
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    @staticmethod
+    def pack(labels):
+        """
+        Returns the utf-8 pool of the labels and the array of their offsets in it
+        """
+        encoded = [str(label).encode() for label in labels]
+        offsets = array('q', [0])
+        total = 0
+        for data in encoded:
+            total += len(data)
+            offsets.append(total)
+        return b''.join(encoded), offsets
+
+
+def _as_array(typecode, values):
+    if isinstance(values, array) and values.typecode == typecode:
+        return values
+    return array(typecode, values)
+
+
+def _indices(ids, index):
+    try:
+        return [index[i] for i in ids]
+    except KeyError as e:
+        raise ValueError(f"{e.args[0]} not in the graph") from None
+
+
+def _pack(rows, index):
+    """
+    Packs a list of id->multiplicity dicts into (offsets, targets, multiplicities) arrays,
+    each row sorted by target index
+    """
+    offsets = array('q', [0])
+    targets = array('i')
+    multiplicities = array('i')
+    for row in rows:
+        for j, m in sorted(zip(_indices(row, index), row.values())):
+            targets.append(j)
+            multiplicities.append(m)
+        offsets.append(len(targets))
+    return offsets, targets, multiplicities
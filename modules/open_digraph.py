@@ -1,10 +1,29 @@
+from contextlib import contextmanager
+import functools
+import heapq
+import io
+import os
 import random
 import re
+import weakref
+from collections import deque
+from collections.abc import MutableMapping
+from types import MappingProxyType
 from urllib.parse import quote
 import webbrowser
 
+from modules.reachability import reachability_index
+from modules.union_find import union_find
+
+try:
+    import numpy as np
+except ImportError: # numpy is optional, the functions that need it say so
+    np = None
+
 class node:
 
+    __slots__ = ('id', 'label', 'parents', 'children', '_indegree', '_outdegree')
+
     def __init__(self, identity, label, parents, children):
         '''
         identity: int; its unique id in the graph
@@ -17,6 +36,9 @@ class node:
         self.label = label
         self.parents = parents
         self.children = children 
+        # Edges in and out, with multiplicities, kept up to date by the methods
+        self._indegree = sum(parents.values()) if parents else 0
+        self._outdegree = sum(children.values()) if children else 0
 
     def __str__(self):
         return f"Node(ID: {self.id}, Label: '{self.label}', Parents: {self.parents}, Children: {self.children})"
@@ -43,6 +65,37 @@ class node:
     def get_children(self):
         return self.children.copy()
 
+    def parents_view(self):
+        '''
+        Read-only view of the parents dict, follows its changes without copying it
+        '''
+        return MappingProxyType(self.parents)
+
+    def children_view(self):
+        '''
+        Read-only view of the children dict, follows its changes without copying it
+        '''
+        return MappingProxyType(self.children)
+
+    def neighbours(self, direction=None):
+        '''
+        Yields the ids of the children if direction is 1, of the parents if -1,
+        of both if None (a node that is both is yielded twice)
+        '''
+        if direction != -1:
+            yield from self.children
+        if direction != 1:
+            yield from self.parents
+
+    def indegree(self):
+        return self._indegree
+
+    def outdegree(self):
+        return self._outdegree
+
+    def degree(self):
+        return self._indegree + self._outdegree
+
     #setters
     def set_id(self, identity: int):
         self.id = identity
@@ -52,21 +105,35 @@ class node:
 
     def set_children(self, child: dict):
         self.children = child
+        self._outdegree = sum(child.values())
+
+    def set_parents(self, parents: dict):
+        self.parents = parents
+        self._indegree = sum(parents.values())
 
-    def add_parent_id(self, parent_id: int):
-        if parent_id in self.parents:
-            self.parents[parent_id] += 1
+    def add_parent_id(self, parent_id: int, multiplicity=1):
+        '''
+        Adds a parent if it's a new id, augments the counter by multiplicity if it isn't
+        (a negative multiplicity takes edges away, the parent goes at 0)
+        '''
+        m = self.parents.get(parent_id, 0) + multiplicity
+        if m:
+            self.parents[parent_id] = m
         else:
-            self.parents[parent_id] = 1
+            del self.parents[parent_id]
+        self._indegree += multiplicity
 
-    def add_child_id(self, child_id: int):
+    def add_child_id(self, child_id: int, multiplicity=1):
         '''
-        Adds a children if it's a new id, augments the counter by one if it isn't
+        Adds a children if it's a new id, augments the counter by multiplicity if it isn't
+        (a negative multiplicity takes edges away, the child goes at 0)
         '''
-        if child_id in self.children:
-            self.children[child_id] += 1
+        m = self.children.get(child_id, 0) + multiplicity
+        if m:
+            self.children[child_id] = m
         else:
-            self.children[child_id] = 1
+            del self.children[child_id]
+        self._outdegree += multiplicity
 
     def remove_parent_once(self, parent: int):
         if not (parent in self.parents.keys()):
@@ -76,6 +143,7 @@ class node:
                 self.parents[parent] -= 1
             else:
                 del self.parents[parent]
+            self._indegree -= 1
 
 
     def remove_child_once(self, child: int):
@@ -86,31 +154,182 @@ class node:
                 self.children[child] -= 1
             else:
                 del self.children[child]
+            self._outdegree -= 1
 
     def remove_parent_id(self, parent: int):
         if parent in self.parents.keys():
-            del self.parents[parent]
+            self._indegree -= self.parents.pop(parent)
         else:
             raise ValueError(f"{parent} not in parents")
 
     def remove_child_id(self, child: int):
         if child in self.children.keys():
-            del self.children[child]
+            self._outdegree -= self.children.pop(child)
         else:
-            raise ValueError(f"{parent} not in parents")
+            raise ValueError(f"{child} not in children")
+
+
+def _grouped(method):
+    '''
+    Makes the mutations done by an open_digraph method a single step of its journal
+    '''
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self._journal is None:
+            return method(self, *args, **kwargs)
+        self._open_step()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self._close_step()
+    return wrapper
+
+
+class _node_overlay(MutableMapping): # nodes of a snapshot, read through to the original
+
+    __slots__ = ('base', 'local', 'tail', 'hidden', 'size', 'owner', '__weakref__')
+
+    def __init__(self, base, owner):
+        '''
+        base: the nodes dict of the original graph, changed by owner only
+        owner: weak reference to the original graph
+        '''
+        self.base = base
+        self.local = {}     # new nodes of the ids of base, at their place in base
+        self.tail = {}      # ids that are not in base, or no longer at their place in it
+        self.hidden = set() # ids of base not shown at their place (removed or in tail)
+        self.size = len(base)
+        self.owner = owner
+
+    def fork(self):
+        """
+        Another overlay on the same base, with the same contents: O(size of the diff)
+        """
+        other = _node_overlay(self.base, self.owner)
+        other.local = self.local.copy()
+        other.tail = self.tail.copy()
+        other.hidden = self.hidden.copy()
+        other.size = self.size
+        return other
+
+    def __getitem__(self, node_id):
+        # Nodes are never None
+        n = self.local.get(node_id)
+        if n is None:
+            n = self.tail.get(node_id)
+            if n is None:
+                if node_id in self.hidden:
+                    raise KeyError(node_id)
+                return self.base[node_id]
+        return n
+
+    def get(self, node_id, default=None):
+        try:
+            return self[node_id]
+        except KeyError:
+            return default
+
+    def __contains__(self, node_id):
+        if node_id in self.local or node_id in self.tail:
+            return True
+        return node_id not in self.hidden and node_id in self.base
+
+    def __setitem__(self, node_id, n):
+        if node_id in self.local:
+            self.local[node_id] = n
+        elif node_id in self.tail:
+            self.tail[node_id] = n
+        elif node_id in self.hidden or node_id not in self.base:
+            self.tail[node_id] = n
+            self.size += 1
+        else:
+            self.local[node_id] = n
+
+    def __delitem__(self, node_id):
+        if node_id in self.local:
+            del self.local[node_id]
+            self.hidden.add(node_id)
+        elif node_id in self.tail:
+            del self.tail[node_id]
+        elif node_id in self.hidden or node_id not in self.base:
+            raise KeyError(node_id)
+        else:
+            self.hidden.add(node_id)
+        self.size -= 1
+
+    def __iter__(self):
+        hidden = self.hidden
+        for node_id in self.base:
+            if node_id not in hidden:
+                yield node_id
+        yield from self.tail
+
+    def __len__(self):
+        return self.size
+
+    def copy(self):
+        return dict(self.items())
+
+    def keep_before_set(self, node_id):
+        """
+        Called by the owner before it sets base[node_id]: keeps the current view
+        """
+        if node_id in self.base:
+            if node_id not in self.local and node_id not in self.hidden:
+                self.local[node_id] = self.base[node_id]
+        else:
+            self.hidden.add(node_id)
+
+    def keep_before_del(self, node_id):
+        """
+        Called by the owner before it removes base[node_id]: keeps the current view
+        (the node then comes last in the iteration order)
+        """
+        if node_id in self.local:
+            self.tail[node_id] = self.local.pop(node_id)
+            self.hidden.add(node_id)
+        elif node_id not in self.hidden:
+            self.tail[node_id] = self.base[node_id]
+            self.hidden.add(node_id)
 
 
 class open_digraph: # for open directed graph
 
-    def __init__(self, inputs=[], outputs=[], nodes=[]):
+    __slots__ = ('inputs', 'outputs', 'nodes', '_next_id', '_free_ids', '_dirty', '_cache',
+                 '_hashcons', '_hashcons_keys', '_hashcons_stale', '_reach', '_snapshots', '_owned',
+                 '_journal', '_redo', '_step', '_depth', '_replaying',
+                 '_indexed', '_by_label', '_by_indegree', '_by_outdegree', '_index_stale',
+                 '_num_edges', '_degree_counts', '_degree_heap', '_degree_stale', '__weakref__')
+
+    def __init__(self, inputs=None, outputs=None, nodes=()):
         '''
         inputs: int list; the ids of the input nodes
         outputs: int list; the ids of the output nodes
         nodes: node iter;
         '''
-        self.inputs = inputs
-        self.outputs = outputs
+        self.inputs = [] if inputs is None else inputs
+        self.outputs = [] if outputs is None else outputs
         self.nodes = {node.id:node for node in nodes} # self.nodes: <int,node> dict 
+        self._reset_id_allocator()
+        self._recount()
+        self._dirty = None # ids to re-check in incremental mode, None when it is off
+        self._cache = {} # results of analyses, emptied by every mutation
+        self._hashcons = None # structural key -> id in hash-consing mode, None when it is off
+        self._hashcons_keys = {} # id -> structural key it is stored under
+        self._hashcons_stale = set() # ids whose structural key may have changed
+        self._reach = None # reachability_index, dropped when edges change and it can't be patched
+        self._snapshots = None # weak references to the _node_overlay of the snapshots on self.nodes
+        self._owned = None # ids of the nodes not shared with a snapshot, None if no node is
+        self._journal = None # steps that undo can take back, None when the journal is off
+        self._redo = [] # steps taken back by undo, most recent last
+        self._step = None # entries of the step being recorded
+        self._depth = 0 # number of open steps, only the outermost one is recorded
+        self._replaying = False # True while undo and redo call the graph methods
+        self._indexed = None # id -> (label, in-degree, out-degree) it is indexed under, None when off
+        self._by_label = {} # label -> ids (dict used as an ordered set)
+        self._by_indegree = {} # in-degree -> ids
+        self._by_outdegree = {} # out-degree -> ids
+        self._index_stale = set() # ids whose index entries may be out of date
 
     def __str__(self):
         nodes_str = ', '.join(str(self.nodes[nid]) for nid in self.nodes)
@@ -121,8 +340,75 @@ class open_digraph: # for open directed graph
         return f"Graph({self.inputs}, {self.outputs}, [{nodes_repr}])"
 
     def copy(self):
+        """
+        Returns a copy sharing nothing with self, in O(size of the graph)
+        """
         copied_nodes = [node.copy() for node in self.nodes.values()]
-        return open_digraph(self.inputs, self.outputs, copied_nodes)
+        g = open_digraph(list(self.inputs), list(self.outputs), copied_nodes)
+        self._copy_state(g)
+        return g
+
+    def snapshot(self):
+        """
+        Returns a copy made in O(1) (plus the inputs, outputs, caches and tables of the
+        enabled modes, and the changes of self if it is a snapshot too):
+        the nodes of the snapshot are an overlay on the nodes dict of the original,
+        which keeps only the changes, and both graphs share the node objects. Each
+        graph clones a node the first time it changes it through the graph methods, and
+        the original copies the nodes it replaces or removes into the live snapshots,
+        so memory grows only with the changes. Reading the nodes of a snapshot is a
+        few times slower than reading a dict.
+        Changes made directly on the original's dict or on a node are seen by both graphs.
+        Since a node is replaced by its clone, a node taken from graph.nodes before a
+        change to the graph may be stale: read graph.nodes[id] again after it.
+        """
+        g = open_digraph(list(self.inputs), list(self.outputs))
+        if isinstance(self.nodes, _node_overlay):
+            # Same base as self: no chain of overlays
+            g.nodes = self.nodes.fork()
+            owner = self.nodes.owner()
+        else:
+            g.nodes = _node_overlay(self.nodes, weakref.ref(self))
+            owner = self
+        if owner is not None and owner.nodes is g.nodes.base:
+            if owner._snapshots is None:
+                owner._snapshots = []
+            owner._snapshots.append(weakref.ref(g.nodes))
+            if owner._owned is None:
+                owner._owned = set()
+        g._owned = set()
+        self._owned = set()
+        self._copy_state(g)
+        return g
+
+    def _copy_state(self, g):
+        """
+        Gives g the same allocator, incremental check, cache and hash-consing state as self
+        """
+        # Same allocator state, so the copy hands out the same ids as the original
+        g._next_id = self._next_id
+        g._free_ids = self._free_ids.copy()
+        if self._dirty is not None:
+            g._dirty = self._dirty.copy()
+        g._cache = self._cache.copy()
+        if self._hashcons is not None:
+            g._hashcons = self._hashcons.copy()
+            g._hashcons_keys = self._hashcons_keys.copy()
+            g._hashcons_stale = self._hashcons_stale.copy()
+        if self._indexed is not None:
+            g._indexed = self._indexed.copy()
+            for table in ('_by_label', '_by_indegree', '_by_outdegree'):
+                setattr(g, table, {key: ids.copy() for key, ids in getattr(self, table).items()})
+            g._index_stale = self._index_stale.copy()
+        g._num_edges = self._num_edges
+        if self._degree_stale is None:
+            g._degree_counts = g._degree_heap = g._degree_stale = None
+        else:
+            if self._degree_stale:
+                self._refresh_degrees()
+            g._degree_counts = self._degree_counts.copy()
+            g._degree_heap = self._degree_heap.copy()
+            g._degree_stale = {}
 
     @classmethod
     def empty(cls):
@@ -150,83 +436,505 @@ class open_digraph: # for open directed graph
     def get_nodes_by_ids(self, ids):
         return [self.nodes[identity] for identity in ids if identity in self.nodes]
 
+    def iter_nodes(self):
+        return iter(self.nodes.values())
+
+    def iter_node_ids(self):
+        return iter(self.nodes)
+
+    def iter_edges(self):
+        """
+        Yields (src, tgt, multiplicity) for each pair of linked nodes, without copying
+        the adjacency. The graph must not change while the generator runs.
+        """
+        for src, n in self.nodes.items():
+            for tgt, multiplicity in n.children.items():
+                yield src, tgt, multiplicity
+
+    def iter_bfs(self, start, direction=1):
+        """
+        Yields the ids reachable from start, breadth first. Stopping the loop early
+        stops the search. The graph must not change while the generator runs.
+        direction: 1 to follow children, -1 to follow parents, None for both
+        """
+        if start not in self.nodes:
+            raise ValueError(f"{start} not in the graph")
+        nodes = self.nodes
+        seen = {start}
+        queue = deque([start])
+        while queue:
+            node_id = queue.popleft()
+            yield node_id
+            for next_id in nodes[node_id].neighbours(direction):
+                if next_id not in seen:
+                    seen.add(next_id)
+                    queue.append(next_id)
+
+    def iter_dfs(self, start, direction=1):
+        """
+        Yields the ids reachable from start, depth first (preorder), without recursion.
+        Stopping the loop early stops the search. The graph must not change while
+        the generator runs.
+        direction: 1 to follow children, -1 to follow parents, None for both
+        """
+        if start not in self.nodes:
+            raise ValueError(f"{start} not in the graph")
+        nodes = self.nodes
+        seen = {start}
+        yield start
+        # One iterator over the neighbours per node of the current path
+        stack = [nodes[start].neighbours(direction)]
+        while stack:
+            for next_id in stack[-1]:
+                if next_id not in seen:
+                    seen.add(next_id)
+                    yield next_id
+                    stack.append(nodes[next_id].neighbours(direction))
+                    break
+            else:
+                stack.pop()
+
+    def num_edges(self):
+        """
+        Number of edges, with multiplicities, in O(1)
+        """
+        return self._num_edges
+
+    def indegree(self, node_id):
+        return self.nodes[node_id].indegree()
+
+    def outdegree(self, node_id):
+        return self.nodes[node_id].outdegree()
+
+    def degree(self, node_id):
+        return self.nodes[node_id].degree()
+
+    def max_degree(self):
+        """
+        Biggest degree (edges in and out) of a node, 0 for an empty graph. The first
+        call counts the degrees in O(n); after that, O(1) if no degree changed since
+        the last call, else O(log n) per node whose degree changed.
+        """
+        if self._degree_stale is None:
+            self._count_degrees()
+        elif self._degree_stale:
+            self._refresh_degrees()
+        heap = self._degree_heap
+        counts = self._degree_counts
+        # A degree left without nodes is only dropped from the heap when it comes on top
+        while heap and -heap[0] not in counts:
+            heapq.heappop(heap)
+        return -heap[0] if heap else 0
+
     #setters
     def set_inputs(self, new_inputs):
+        if self._journal is not None:
+            self._log((self.set_inputs, (self.inputs,)), (self.set_inputs, (new_inputs,)))
         self.inputs = new_inputs
+        self._touch(*new_inputs, edges=False)
 
     def set_outputs(self, new_outputs):
+        if self._journal is not None:
+            self._log((self.set_outputs, (self.outputs,)), (self.set_outputs, (new_outputs,)))
         self.outputs = new_outputs
+        self._touch(*new_outputs, edges=False)
+
+    def set_node_label(self, node_id, label):
+        if self._journal is not None:
+            self._log((self.set_node_label, (node_id, self.nodes[node_id].label)),
+                      (self.set_node_label, (node_id, label)))
+        self._own(node_id).set_label(label)
+        self._touch(node_id, edges=False)
 
     def add_input_id(self, input_id):
         if input_id not in self.inputs:
+            if self._journal is not None:
+                self._log((self._pop_io, ('inputs',)), (self.add_input_id, (input_id,)))
             self.inputs.append(input_id)
+            self._touch(input_id, edges=False)
 
     def add_output_id(self, output_id):
         if output_id not in self.outputs:
+            if self._journal is not None:
+                self._log((self._pop_io, ('outputs',)), (self.add_output_id, (output_id,)))
             self.outputs.append(output_id)
+            self._touch(output_id, edges=False)
+
+    def _recount(self):
+        """
+        Rebuilds the edge count from the nodes. The degree counts are dropped: they
+        are only kept once max_degree has been called
+        """
+        self._num_edges = sum(n._outdegree for n in self.nodes.values())
+        self._degree_counts = None
+        self._degree_heap = None
+        self._degree_stale = None
+
+    def _count_degrees(self):
+        """
+        Builds the degree counts from the nodes
+        """
+        counts = {} # degree -> number of nodes
+        for n in self.nodes.values():
+            degree = n._indegree + n._outdegree
+            counts[degree] = counts.get(degree, 0) + 1
+        self._degree_counts = counts
+        self._degree_heap = [-degree for degree in counts] # max-heap of the degrees in counts
+        heapq.heapify(self._degree_heap)
+        # id -> degree it is counted with (None: not counted), recorded by the edge
+        # changes before their first change of the node, and applied by max_degree
+        self._degree_stale = {}
+
+    def _move_degree(self, old, new):
+        """
+        Moves one node from the count of degree old to the count of degree new
+        (None for a node that is not counted)
+        """
+        counts = self._degree_counts
+        if old is not None:
+            left = counts[old] - 1
+            if left:
+                counts[old] = left
+            else:
+                del counts[old]
+        if new is not None:
+            if new in counts:
+                counts[new] += 1
+            else:
+                counts[new] = 1
+                heapq.heappush(self._degree_heap, -new)
+
+    def _refresh_degrees(self):
+        """
+        Moves the nodes whose degree changed since the last call to their new count
+        """
+        nodes = self.nodes
+        for node_id, old in self._degree_stale.items():
+            n = nodes.get(node_id)
+            new = None if n is None else n._indegree + n._outdegree
+            if new != old:
+                self._move_degree(old, new)
+        self._degree_stale.clear()
+        counts = self._degree_counts
+        if len(self._degree_heap) > 2 * len(counts) + 16:
+            # Mostly degrees without nodes: start again from the counts
+            self._degree_heap = [-degree for degree in counts]
+            heapq.heapify(self._degree_heap)
+
+    def _link(self, src, tgt, delta):
+        """
+        Adds delta (negative to take edges away) to the multiplicity of src -> tgt on
+        both sides, and to the edge count
+        """
+        if self._owned is None:
+            nodes = self.nodes
+            s = nodes[src]
+            t = nodes[tgt]
+        else:
+            s = self._own(src)
+            t = self._own(tgt)
+        # The old degrees of both ends go to _degree_stale, then s.add_child_id(tgt, delta)
+        # and t.add_parent_id(src, delta), inlined: this is the hot path of every edge change
+        stale = self._degree_stale
+        if stale is not None:
+            if src not in stale:
+                stale[src] = s._indegree + s._outdegree
+            if tgt not in stale:
+                stale[tgt] = t._indegree + t._outdegree
+        children = s.children
+        m = children.get(tgt, 0) + delta
+        if m:
+            children[tgt] = m
+        else:
+            del children[tgt]
+        s._outdegree += delta
+        parents = t.parents
+        m = parents.get(src, 0) + delta
+        if m:
+            parents[src] = m
+        else:
+            del parents[src]
+        t._indegree += delta
+        self._num_edges += delta
+
+    def _reset_id_allocator(self):
+        """
+        Rebuilds the id allocator from self.nodes: a counter past the biggest
+        integer id and a min-heap of the [lo, hi) ranges of unused ids below it,
+        in O(n log n) whatever the size of the ids
+        """
+        int_ids = sorted(i for i in self.nodes if isinstance(i, int) and i >= 0)
+        self._next_id = int_ids[-1] + 1 if int_ids else 0
+        # Sorted, so the list is already a valid heap
+        self._free_ids = [(lo + 1, hi) for lo, hi in zip([-1] + int_ids, int_ids) if hi > lo + 1]
 
     def new_id(self):
-        existing_ids = set(self.nodes.keys())
-        new_id = 0
-        while new_id in existing_ids:
-            new_id += 1
+        """
+        Returns the smallest unused id, in O(log n) amortized. Nothing is reserved:
+        calling it twice gives the same id until a node is added.
+        """
+        # Ids freed by remove_node_by_id come first; skip the ones taken back since
+        free = self._free_ids
+        while free and free[0][0] in self.nodes:
+            lo, hi = free[0]
+            if lo + 1 < hi:
+                heapq.heapreplace(free, (lo + 1, hi))
+            else:
+                heapq.heappop(free)
+        if free:
+            return free[0][0]
+        # Skip ids that were put in self.nodes by hand
+        while self._next_id in self.nodes:
+            self._next_id += 1
+        return self._next_id
+
+    def _allocate_id(self):
+        """
+        Returns new_id() and marks it as used, for the methods that add a node
+        """
+        free = self._free_ids
+        if not free:
+            # No freed id: only the ids put in self.nodes by hand are skipped, as in new_id
+            new_id = self._next_id
+            nodes = self.nodes
+            while new_id in nodes:
+                new_id += 1
+            self._next_id = new_id + 1
+            return new_id
+        new_id = self.new_id()
+        if free:
+            lo, hi = free[0]
+            if lo + 1 < hi:
+                heapq.heapreplace(free, (lo + 1, hi))
+            else:
+                heapq.heappop(free)
+        else:
+            self._next_id += 1
         return new_id
 
     def add_edge(self, src: int, tgt: int):
-        if src in self.nodes and tgt in self.nodes:
-            # .get: if key not found, then returns seconds parameter (0 in this case)
-            # +1 to edge count in the children of the src node
-            self.nodes[src].children[tgt] = self.nodes[src].children.get(tgt, 0) + 1
-            # +1 to edge count in the parents of the tgt node
-            self.nodes[tgt].parents[src] = self.nodes[tgt].parents.get(src, 0) + 1
-
+        nodes = self.nodes
+        if src in nodes and tgt in nodes:
+            # +1 to edge count in the children of the src node and the parents of the tgt node:
+            # _link(src, tgt, 1), inlined for the common case with no snapshot around
+            if self._owned is not None:
+                self._link(src, tgt, 1)
+            else:
+                s = nodes[src]
+                t = nodes[tgt]
+                stale = self._degree_stale
+                if stale is not None:
+                    if src not in stale:
+                        stale[src] = s._indegree + s._outdegree
+                    if tgt not in stale:
+                        stale[tgt] = t._indegree + t._outdegree
+                children = s.children
+                children[tgt] = children.get(tgt, 0) + 1
+                s._outdegree += 1
+                parents = t.parents
+                parents[src] = parents.get(src, 0) + 1
+                t._indegree += 1
+                self._num_edges += 1
+            if self._journal is not None:
+                self._log((self.remove_edge, (src, tgt)), (self.add_edge, (src, tgt)))
+            if self._reach is not None and not self._reach.add_edge(src, tgt):
+                self._reach = None
+            self._touch(src, tgt, edges=False)
+
+    @_grouped
     def add_edges(self, edges: list):
         for src, tgt in edges:
             self.add_edge(src, tgt)
 
-    def add_node(self, label='', parents=None, children=None):
+    @_grouped
+    def add_nodes_bulk(self, labels):
+        """
+        Adds one isolated node per label in labels and returns the list of their ids
+        """
+        new_ids = []
+        for label in labels:
+            newid = self._allocate_id()
+            self._put(node(newid, label, {}, {}))
+            new_ids.append(newid)
+            if self._reach is not None and not self._reach.add_node(newid, {}, {}):
+                self._reach = None
+            if self._journal is not None:
+                self._log((self.remove_node_by_id, (newid,)), (self._insert_node, (newid, label, {}, {})))
+        self._touch(*new_ids, edges=False)
+        return new_ids
+
+    @_grouped
+    def add_edges_bulk(self, edges):
+        """
+        Adds many edges in a single pass.
+        edges: (src, tgt) pairs, (src, tgt, multiplicity) triples,
+               or a (src, tgt) -> multiplicity dict (e.g. a collections.Counter)
+        Every endpoint is checked once at the end, before the graph is modified:
+        raises a ValueError if one of them is not in the graph.
+        """
+        children_maps, parents_maps = _count_edges(edges)
+        missing = [i for i in children_maps if i not in self.nodes]
+        missing += [i for i in parents_maps if i not in self.nodes]
+        if missing:
+            raise ValueError(f"{missing[0]} not in the graph")
+        if self._journal is not None:
+            for src, counts in children_maps.items():
+                for tgt, multiplicity in counts.items():
+                    self._log((self._change_edge, (src, tgt, -multiplicity)),
+                              (self._change_edge, (src, tgt, multiplicity)))
+
+        # The degree counts, when kept, follow every node right away (it costs O(1)
+        # per node), unless the node already waits for max_degree in _degree_stale
+        stale = self._degree_stale
+        for src, counts in children_maps.items():
+            n = self._own(src)
+            old_out = n._outdegree
+            if not n.children:
+                # The counts are fresh dicts: a node without children can take them as they are
+                n.set_children(counts)
+            else:
+                for tgt, multiplicity in counts.items():
+                    n.add_child_id(tgt, multiplicity)
+            self._num_edges += n._outdegree - old_out
+            if stale is not None and src not in stale:
+                old = n._indegree + old_out
+                self._move_degree(old, old + n._outdegree - old_out)
+        for tgt, counts in parents_maps.items():
+            n = self._own(tgt)
+            old_in = n._indegree
+            if not n.parents:
+                n.set_parents(counts)
+            else:
+                for src, multiplicity in counts.items():
+                    n.add_parent_id(src, multiplicity)
+            if stale is not None and tgt not in stale:
+                old = old_in + n._outdegree
+                self._move_degree(old, old + n._indegree - old_in)
+        self._touch(*children_maps, *parents_maps)
+
+    @classmethod
+    def from_edge_list(cls, edges, labels=None, inputs=None, outputs=None):
+        """
+        Builds a graph straight from its edges, in a single pass.
+        edges: same formats as add_edges_bulk
+        labels: int->string dict; labels of the nodes, and nodes without edges
+        Nodes keep the ids used in edges and labels.
+        """
+        if labels is None:
+            labels = {}
+        children_maps, parents_maps = _count_edges(edges)
+
+        node_ids = dict.fromkeys(labels)
+        node_ids.update(dict.fromkeys(children_maps))
+        node_ids.update(dict.fromkeys(parents_maps))
+        nodes = [node(i, labels.get(i, ''), parents_maps.get(i, {}), children_maps.get(i, {}))
+                 for i in node_ids]
+        return cls(inputs=list(inputs or []), outputs=list(outputs or []), nodes=nodes)
+
+    def add_node(self, label='', parents=None, children=None, share=True):
+        '''
+        Adds a node linked to parents and children (id->multiplicity dicts), returns its id.
+        share: with hash-consing on, False always creates a new node
+        '''
         if parents is None:
             parents = {}
         if children is None:
             children = {}
+        if self._hashcons is not None and share and parents and not children:
+            # Hash-consing: an equivalent gate may already exist
+            existing = self._hashcons_lookup(structural_key(label, parents))
+            if existing is not None:
+                return existing
         # New id generated
-        newid = self.new_id()
+        newid = self._allocate_id()
+        self._insert_node(newid, label, parents, children)
+        if self._journal is not None:
+            self._log((self.remove_node_by_id, (newid,)),
+                      (self._insert_node, (newid, label, parents.copy(), children.copy())))
+        # Return the id of the new node
+        return newid
 
+    def _insert_node(self, newid, label, parents, children):
+        """
+        Adds a node with the given id and links it with its parents and children
+        """
         # Create a new node that will later be added to the graph
         new_node = node(newid, label, parents.copy(), children.copy())
-        self.nodes[newid] = new_node
-
-        # Link the new node with its parents
+        self._put(new_node)
+
+        # Link the new node with its parents (only the missing edges: the parent may
+        # already point to it when the journal puts back a removed block of nodes)
+        # The neighbours are taken straight from self.nodes when no snapshot shares them
+        nodes = self.nodes
+        get = nodes.get if self._owned is None else None
+        stale = self._degree_stale
         for parent_id, multiplicity in parents.items():
-            if parent_id in self.nodes:
-                self.nodes[parent_id].children[newid] = multiplicity
+            p = get(parent_id) if get else self._own(parent_id) if parent_id in nodes else None
+            if p is not None:
+                children_p = p.children
+                delta = multiplicity - children_p.get(newid, 0)
+                if delta:
+                    if stale is not None and parent_id not in stale: # as in _link
+                        stale[parent_id] = p._indegree + p._outdegree
+                    # p.add_child_id(newid, delta), inlined: the new count is multiplicity
+                    children_p[newid] = multiplicity
+                    p._outdegree += delta
+                    self._num_edges += delta
 
         # Link the new node with its children
         for child_id, multiplicity in children.items():
-            if child_id in self.nodes:
-                self.nodes[child_id].parents[newid] = multiplicity
-        # Return the id of the new node
-        return newid
+            c = get(child_id) if get else self._own(child_id) if child_id in nodes else None
+            if c is not None:
+                parents_c = c.parents
+                delta = multiplicity - parents_c.get(newid, 0)
+                if delta:
+                    if stale is not None and child_id not in stale:
+                        stale[child_id] = c._indegree + c._outdegree
+                    parents_c[newid] = multiplicity
+                    c._indegree += delta
+        if self._reach is not None and not self._reach.add_node(newid, parents, children):
+            self._reach = None
+        self._touch(newid, *parents, *children, edges=False)
 
     def remove_edge(self, src: int, tgt: int):
         if src in self.nodes and tgt in self.nodes: 
-            self.nodes[src].remove_child_once(tgt)
-            self.nodes[tgt].remove_parent_once(src)
+            if tgt not in self.nodes[src].children:
+                raise ValueError(f"{tgt} not in children")
+            self._link(src, tgt, -1)
+            if self._journal is not None:
+                self._log((self.add_edge, (src, tgt)), (self.remove_edge, (src, tgt)))
+            self._touch(src, tgt)
         else:
             raise ValueError(f"{src} or {tgt} not in the graph")
 
     def remove_parallel_edges(self, src: int, tgt: int):
         if src in self.nodes and tgt in self.nodes: 
-            self.nodes[src].remove_child_id(tgt)
-            self.nodes[tgt].remove_parent_id(src)
+            multiplicity = self.nodes[src].children.get(tgt)
+            if multiplicity is None:
+                raise ValueError(f"{tgt} not in children")
+            self._link(src, tgt, -multiplicity)
+            if self._journal is not None:
+                self._log((self._change_edge, (src, tgt, multiplicity)),
+                          (self.remove_parallel_edges, (src, tgt)))
+            self._touch(src, tgt)
         else:
             raise ValueError(f"{src} or {tgt} not in the graph")
 
+    def _change_edge(self, src, tgt, delta):
+        """
+        Adds delta (negative to remove edges) to the multiplicity of src -> tgt
+        """
+        self._link(src, tgt, delta)
+        if self._journal is not None:
+            self._log((self._change_edge, (src, tgt, -delta)), (self._change_edge, (src, tgt, delta)))
+        self._touch(src, tgt)
+
+    @_grouped
     def remove_node_by_id(self, node_id: int):
         # List of node parents
         pn = list(self.nodes[node_id].parents.keys())
-        # List of node children
-        cn = list(self.nodes[node_id].children.keys())
+        # List of node children (a loop is removed with the parents)
+        cn = [child_id for child_id in self.nodes[node_id].children if child_id != node_id]
 
         # Eliminate all the parents of node from both sides
         for parent_id in pn:
@@ -236,75 +944,441 @@ class open_digraph: # for open directed graph
         for child_id in cn:
             self.remove_parallel_edges(node_id, child_id)
         # Eliminate the node from the list
-        del self.nodes[node_id]
-
+        if self._journal is not None:
+            # The edges are logged by remove_parallel_edges, only the bare node is left
+            self._log((self._insert_node, (node_id, self.nodes[node_id].label, {}, {})),
+                      (self.remove_node_by_id, (node_id,)))
+        n = self.nodes[node_id]
+        self._num_edges -= n._outdegree
+        stale = self._degree_stale
+        if stale is not None and node_id not in stale:
+            self._move_degree(n._indegree + n._outdegree, None)
+        self._del_node(node_id)
+        if self._owned is not None:
+            self._owned.discard(node_id)
+        self._touch(node_id)
+        # Give its id back to the allocator
+        if isinstance(node_id, int) and 0 <= node_id < self._next_id:
+            heapq.heappush(self._free_ids, (node_id, node_id + 1))
+
+    @_grouped
     def remove_edges(self, *edges: tuple):
         for src, tgt in edges:
             self.remove_edge(src, tgt)
 
+    @_grouped
     def remove_several_parallel_edges(self, *edges):
         for src, tgt in edges:
             self.remove_parallel_edges(src, tgt)
 
+    @_grouped
     def remove_nodes_by_id(self, *node_ids: tuple):
         for node_id in node_ids:
             self.remove_node_by_id(node_id)
 
-    def is_well_formed(self):
+    def enable_incremental_check(self):
+        """
+        From now on, is_well_formed only re-checks the nodes touched by the graph
+        methods (add_*, remove_*, input/output setters) since the last successful
+        check. The first check after this call is a full one.
+        Changes made directly on self.nodes or on a node are not tracked.
+        """
+        self._dirty = set(self.nodes)
+        self._dirty.update(self.inputs)
+        self._dirty.update(self.outputs)
 
-        for output_id in self.outputs:
-            # Check if outputs are in the graph
-            if not output_id in self.nodes:
-                return False
-            # Check if outputs have a single parent 
-            if len(self.nodes[output_id].parents) != 1:  
-                    return False
-            # Check if its multiplicity is 1
-            parent_list = list(self.nodes[output_id].parents.values())
-            if parent_list[0] != 1:
-                return False
-            # Check if outputs have no children
-            if self.nodes[output_id].children != {}:
-                return False
-
-        for input_id in self.inputs:
-            # Check if inputs are in the graph
-            if not input_id in self.nodes:
-                return False
-            # Check if inputs have a single child
-            if len(self.nodes[input_id].children) != 1:  
-                    return False
-            # Check if its multiplicity is 1
-            child_list = list(self.nodes[input_id].children.values())
-            if child_list[0] != 1:
-                return False
-
-            # Check if inputs has no parents
-            if self.nodes[input_id].parents != {}:
-                return False
+    def disable_incremental_check(self):
+        self._dirty = None
 
-        for node_id, node in self.nodes.items():
-            # Check if each key in nodes corresponds to a node with the same id
-            node_id2 = self.nodes[node_id].get_id()
-            if node_id != node_id2:
-                return False
+    def _live_snapshots(self):
+        """
+        Returns the overlays of the live snapshots on self.nodes. Once there are none,
+        the nodes of self are not shared any more and are no longer cloned.
+        """
+        live = []
+        for ref in self._snapshots:
+            overlay = ref()
+            if overlay is not None and overlay.base is self.nodes:
+                live.append(overlay)
+        if live:
+            self._snapshots = [weakref.ref(overlay) for overlay in live]
+        else:
+            self._snapshots = None
+            if not isinstance(self.nodes, _node_overlay):
+                self._owned = None
+        return live
+
+    def _set_node(self, node_id, n):
+        if self._snapshots is not None:
+            for overlay in self._live_snapshots():
+                overlay.keep_before_set(node_id)
+        self.nodes[node_id] = n
+
+    def _del_node(self, node_id):
+        if self._snapshots is not None:
+            for overlay in self._live_snapshots():
+                overlay.keep_before_del(node_id)
+        del self.nodes[node_id]
+
+    def _own(self, node_id):
+        """
+        Returns the node of node_id, cloned first if it may be shared with a snapshot
+        """
+        if self._owned is None or node_id in self._owned:
+            return self.nodes[node_id]
+        n = self.nodes[node_id].copy()
+        self._set_node(node_id, n)
+        if self._owned is not None: # None if the last snapshot is gone
+            self._owned.add(node_id)
+        return n
+
+    def _put(self, n):
+        """
+        Adds the new node n to self.nodes
+        """
+        if self._snapshots is None:
+            self.nodes[n.id] = n
+        else:
+            self._set_node(n.id, n)
+        if self._owned is not None:
+            self._owned.add(n.id)
+        self._num_edges += n._outdegree
+        stale = self._degree_stale
+        if stale is not None and n.id not in stale:
+            self._move_degree(None, n._indegree + n._outdegree)
+
+    def _touch(self, *node_ids, edges=True):
+        """
+        Called by every mutation method with the ids of the nodes it changed.
+        edges: False if the method left the edges alone or patched the reachability index
+        """
+        if edges:
+            self._reach = None
+        if self._dirty is not None:
+            self._dirty.update(node_ids)
+        if self._cache:
+            self._cache.clear()
+        if self._hashcons is not None:
+            self._hashcons_stale.update(node_ids)
+        if self._indexed is not None:
+            self._index_stale.update(node_ids)
+
+    def enable_journal(self):
+        """
+        From now on, the graph methods record how to take back each change, for
+        undo, redo and transaction. Each call of a graph method is one step.
+        Changes made directly on self.nodes or on a node are not recorded.
+        """
+        if self._journal is None:
+            self._journal = []
+            self._redo = []
 
-            # Check condition 5
-            for child_id, child_multiplicity in node.children.items():
+    def disable_journal(self):
+        self._journal = None
+        self._redo = []
 
-                child_node = self.nodes[child_id]
-                if node_id not in child_node.parents or child_node.parents[node_id] != child_multiplicity:
-                    return False  
+    def _log(self, undo, redo):
+        """
+        Records a change: undo and redo are (bound method, args) pairs that take it back
+        and make it again
+        """
+        if self._replaying:
+            return
+        if self._step is not None:
+            self._step.append((undo, redo))
+        else:
+            self._journal.append([(undo, redo)])
+            self._redo.clear()
+
+    def _open_step(self):
+        self._depth += 1
+        if self._depth == 1:
+            self._step = []
+
+    def _close_step(self):
+        self._depth -= 1
+        if self._depth == 0:
+            step, self._step = self._step, None
+            if step and self._journal is not None:
+                self._journal.append(step)
+                self._redo.clear()
+
+    def _replay(self, calls):
+        self._replaying = True
+        try:
+            for method, args in calls:
+                method(*args)
+        finally:
+            self._replaying = False
+
+    def undo(self):
+        """
+        Takes back the last step of the journal. Returns False if there is none
+        """
+        if not self._journal:
+            return False
+        step = self._journal.pop()
+        self._replay(undo for undo, _ in reversed(step))
+        self._redo.append(step)
         return True
 
+    def redo(self):
+        """
+        Makes again the last step taken back by undo. Returns False if there is none
+        """
+        if not self._redo:
+            return False
+        step = self._redo.pop()
+        self._replay(redo for _, redo in step)
+        self._journal.append(step)
+        return True
+
+    @contextmanager
+    def transaction(self):
+        """
+        with graph.transaction(): the changes made in the block are one step of the
+        journal, and are all taken back if the block raises an exception (which is
+        then raised again). The journal is on for the block if it was off, and only
+        costs O(changes).
+        """
+        started = self._journal is None
+        if started:
+            self.enable_journal()
+        self._open_step()
+        start = len(self._step) # Inner transactions only take back their own changes
+        try:
+            yield self
+        except BaseException:
+            entries = self._step[start:]
+            del self._step[start:]
+            self._replay(undo for undo, _ in reversed(entries))
+            raise
+        finally:
+            self._close_step()
+            if started:
+                self.disable_journal()
+
+    def _pop_io(self, io):
+        """
+        Takes back the last id added to io, 'inputs' or 'outputs'
+        """
+        node_id = getattr(self, io).pop()
+        self._touch(node_id, edges=False)
+
+    def enable_hash_consing(self):
+        """
+        From now on, add_node returns the id of an existing node instead of creating a
+        new one when the node would have the same label and the same parents (with
+        multiplicities). Only nodes created with parents and without children are
+        shared; inputs and outputs never are, and add_input_node and add_output_node
+        always create a new node. The table is filled with the nodes
+        already in the graph and kept up to date by the mutation methods.
+        """
+        self._hashcons = {}
+        self._hashcons_keys = {}
+        self._hashcons_stale = set(self.nodes)
+
+    def disable_hash_consing(self):
+        self._hashcons = None
+        self._hashcons_keys = {}
+        self._hashcons_stale = set()
+
+    def enable_node_index(self):
+        """
+        Keeps the ids of the nodes by label, in-degree and out-degree (counted with
+        multiplicities), so that nodes_with_label, nodes_with_indegree,
+        nodes_with_outdegree, sources and sinks take O(size of the result) instead
+        of a scan of the graph, but their results are then not in the order of
+        self.nodes. The index is updated from the nodes changed by the graph methods
+        since the last query; changes made directly on a node are not seen.
+        """
+        self._indexed = {}
+        self._by_label = {}
+        self._by_indegree = {}
+        self._by_outdegree = {}
+        self._index_stale = set(self.nodes)
+
+    def disable_node_index(self):
+        self._indexed = None
+        self._by_label = {}
+        self._by_indegree = {}
+        self._by_outdegree = {}
+        self._index_stale = set()
+
+    def _refresh_index(self):
+        """
+        Moves the nodes changed since the last query to their new index entries
+        """
+        tables = (self._by_label, self._by_indegree, self._by_outdegree)
+        for node_id in self._index_stale:
+            n = self.nodes.get(node_id)
+            keys = None if n is None else (n.label, n._indegree, n._outdegree)
+            old_keys = self._indexed.get(node_id)
+            if keys == old_keys:
+                continue
+            if old_keys is not None:
+                for table, key in zip(tables, old_keys):
+                    ids = table[key]
+                    del ids[node_id]
+                    if not ids:
+                        del table[key]
+            if keys is None:
+                del self._indexed[node_id]
+                continue
+            self._indexed[node_id] = keys
+            for table, key in zip(tables, keys):
+                table.setdefault(key, {})[node_id] = None
+        self._index_stale.clear()
+
+    def _query_index(self, position, key):
+        """
+        Ids of the nodes whose (label, in-degree, out-degree)[position] is key
+        """
+        if self._indexed is None:
+            return [node_id for node_id, n in self.nodes.items()
+                    if (n.label, n._indegree, n._outdegree)[position] == key]
+        if self._index_stale:
+            self._refresh_index()
+        table = (self._by_label, self._by_indegree, self._by_outdegree)[position]
+        return list(table.get(key, ()))
+
+    def nodes_with_label(self, label):
+        """
+        Returns the ids of the nodes labelled label (see enable_node_index)
+        """
+        return self._query_index(0, label)
+
+    def nodes_with_indegree(self, degree):
+        """
+        Returns the ids of the nodes with degree edges coming in (see enable_node_index)
+        """
+        return self._query_index(1, degree)
+
+    def nodes_with_outdegree(self, degree):
+        """
+        Returns the ids of the nodes with degree edges going out (see enable_node_index)
+        """
+        return self._query_index(2, degree)
+
+    def sources(self):
+        """
+        Returns the ids of the nodes without parents
+        """
+        return self.nodes_with_indegree(0)
+
+    def sinks(self):
+        """
+        Returns the ids of the nodes without children
+        """
+        return self.nodes_with_outdegree(0)
+
+    def structural_hash(self, node_id):
+        """
+        Hash of the label and parents of a node: equal for structurally identical gates
+        """
+        n = self.nodes[node_id]
+        return hash(structural_key(n.label, n.parents))
+
+    def _hashcons_lookup(self, key):
+        """
+        Id of the node stored under this structural key, None if there is none.
+        The keys of the nodes changed since the last lookup are updated first.
+        """
+        table = self._hashcons
+        if self._hashcons_stale:
+            keys = self._hashcons_keys
+            io_ids = set(self.inputs) | set(self.outputs)
+            for node_id in self._hashcons_stale:
+                old_key = keys.pop(node_id, None)
+                if old_key is not None and table.get(old_key) == node_id:
+                    del table[old_key]
+            for node_id in self._hashcons_stale:
+                n = self.nodes.get(node_id)
+                if n is not None and n.parents and node_id not in io_ids:
+                    new_key = structural_key(n.label, n.parents)
+                    # A structural duplicate made before hash-consing keeps the first id
+                    if table.setdefault(new_key, node_id) == node_id:
+                        keys[node_id] = new_key
+            self._hashcons_stale.clear()
+        return table.get(key)
+
+    def _node_errors(self, node_id, input_ids, output_ids):
+        """
+        Yields a description of each well-formedness condition broken at node_id
+        """
+        n = self.nodes.get(node_id)
+        for kind, io_ids, edges, other in (('output', output_ids, 'parents', 'children'),
+                                           ('input', input_ids, 'children', 'parents')):
+            if node_id not in io_ids:
+                continue
+            # Check if inputs/outputs are in the graph
+            if n is None:
+                yield f"{kind} {node_id} is not in the graph"
+                return
+            # Check if they have a single parent/child, with multiplicity 1, and nothing on the other side
+            links = getattr(n, edges)
+            if len(links) != 1:
+                yield f"{kind} {node_id} has {len(links)} {edges} instead of 1"
+            elif next(iter(links.values())) != 1:
+                yield f"{kind} {node_id} has an edge of multiplicity {next(iter(links.values()))}"
+            if getattr(n, other):
+                yield f"{kind} {node_id} has {other}"
+        if n is None:
+            return
+
+        # Check if each key in nodes corresponds to a node with the same id
+        if n.id != node_id:
+            yield f"node stored under id {node_id} has id {n.id}"
+
+        # Check condition 5: each edge is seen from both sides with the same multiplicity
+        for child_id, child_multiplicity in n.children.items():
+            child_node = self.nodes.get(child_id)
+            if child_node is None:
+                yield f"edge {node_id} -> {child_id} points to a node that is not in the graph"
+            elif child_node.parents.get(node_id) != child_multiplicity:
+                yield (f"edge {node_id} -> {child_id} has multiplicity {child_multiplicity} in the children "
+                       f"of {node_id} but {child_node.parents.get(node_id, 0)} in the parents of {child_id}")
+        # And the other way round, so that a touched node is checked from both sides
+        for parent_id, parent_multiplicity in n.parents.items():
+            parent_node = self.nodes.get(parent_id)
+            if parent_node is None:
+                yield f"edge {parent_id} -> {node_id} comes from a node that is not in the graph"
+            elif parent_node.children.get(node_id) != parent_multiplicity:
+                yield (f"edge {parent_id} -> {node_id} has multiplicity {parent_multiplicity} in the parents "
+                       f"of {node_id} but {parent_node.children.get(node_id, 0)} in the children of {parent_id}")
+
+    def well_formedness_errors(self):
+        """
+        Returns the list of broken well-formedness conditions, empty if the graph is well formed.
+        In incremental mode only the touched nodes are checked, and they are
+        forgotten once they are all fine.
+        """
+        input_ids = set(self.inputs)
+        output_ids = set(self.outputs)
+        if self._dirty is None:
+            node_ids = list(self.nodes)
+            node_ids += [i for i in output_ids | input_ids if i not in self.nodes]
+        else:
+            node_ids = self._dirty
+        errors = [error for node_id in node_ids
+                  for error in self._node_errors(node_id, input_ids, output_ids)]
+        if not errors and self._dirty is not None:
+            self._dirty.clear()
+        return errors
+
+    def is_well_formed(self):
+        return not self.well_formedness_errors()
+
     def assert_is_well_formed(self):
         """
-        Asserts if the graph is well formed, if not sends a ValueError
+        Asserts if the graph is well formed, if not sends a ValueError naming the broken conditions
         """
-        if not self.is_well_formed():
-            raise ValueError("The graph is not well_formed")
+        errors = self.well_formedness_errors()
+        if errors:
+            raise ValueError("The graph is not well_formed: " + "; ".join(errors))
 
 
+    @_grouped
     def add_input_node(self, child_id):
         """
         Creates a new node, defines it as an input, points it to the node with the given child_id and returns its id
@@ -312,11 +1386,12 @@ class open_digraph: # for open directed graph
         # Check if child_id is not in graph
         if not child_id in self.nodes:
             raise ValueError(f"{child_id} doesn't exist in graph")
-        new_id = self.add_node(children = {child_id : 1})
-        self.inputs.append(new_id)
+        new_id = self.add_node(children = {child_id : 1}, share=False)
+        self.add_input_id(new_id)
         return new_id
 
 
+    @_grouped
     def add_output_node(self, parent_id):
         """
         Creates a new node, defines it as an output, points it to the node with the given parent_id and returns its id
@@ -325,41 +1400,393 @@ class open_digraph: # for open directed graph
         # Check if the child_id node exists and does not have other children
         if parent_id not in self.nodes:
             raise ValueError(f"{parent_id} doesn't exist in graph")
-        new_id = self.add_node(parents={parent_id: 1}) 
-        self.outputs.append(new_id)
+        # Never an existing node: it would be an output with children
+        new_id = self.add_node(parents={parent_id: 1}, share=False)
+        self.add_output_id(new_id)
         return new_id
 
+    def min_id(self):
+        return min(self.nodes)
+
+    def max_id(self):
+        return max(self.nodes)
+
+    def shift_indices(self, n):
+        """
+        Adds n to every id of the graph, in place
+        """
+        if self._journal is not None:
+            self._log((self.shift_indices, (-n,)), (self.shift_indices, (n,)))
+        self.nodes = {node_id + n: node(node_id + n, nd.label,
+                                        {p + n: m for p, m in nd.parents.items()},
+                                        {c + n: m for c, m in nd.children.items()})
+                      for node_id, nd in self.nodes.items()}
+        # Every node is new: nothing is shared any more, the snapshots keep the old dict
+        self._snapshots = None
+        self._owned = None
+        self.inputs = [i + n for i in self.inputs]
+        self.outputs = [o + n for o in self.outputs]
+        self._reset_id_allocator()
+        self._recount()
+        self._touch(*self.nodes)
+        # The tables keyed by the old ids are rebuilt
+        if self._hashcons is not None:
+            self.enable_hash_consing()
+        if self._indexed is not None:
+            self.enable_node_index()
+
+    def _shift_for(self, g):
+        """
+        Shift to apply to the ids of g so that they don't meet the ids of self.
+        Every id from _next_id on is free unless it was put in self.nodes by hand,
+        so the maximum of self is only looked for when that happens.
+        """
+        if not g.nodes:
+            return 0
+        shift = self._next_id - g.min_id()
+        if any(node_id + shift in self.nodes for node_id in g.nodes):
+            shift = self.max_id() + 1 - g.min_id()
+        return shift
+
+    def _add_shifted(self, g, shift):
+        """
+        Copies the nodes of g into self, with their ids shifted by shift.
+        g may be self: its nodes are listed before any is added.
+        """
+        items = list(g.nodes.items())
+        for node_id, nd in items:
+            new_id = node_id + shift
+            parents = {p + shift: m for p, m in nd.parents.items()}
+            children = {c + shift: m for c, m in nd.children.items()}
+            self._put(node(new_id, nd.label, parents, children))
+            if self._journal is not None:
+                self._log((self.remove_node_by_id, (new_id,)),
+                          (self._insert_node, (new_id, nd.label, parents.copy(), children.copy())))
+        if items:
+            self._next_id = max(self._next_id, max(node_id for node_id, _ in items) + shift + 1)
+        self._touch(*(node_id + shift for node_id, _ in items))
+
+    @_grouped
+    def iparallel(self, g):
+        """
+        Adds a copy of g next to self (disjoint union), in place. The ids of g are
+        shifted on the fly, in O(size of g); self is left untouched, so g should be
+        the smaller graph. g may be self. The inputs and outputs of g come after
+        those of self.
+        Returns the shift applied to the ids of g.
+        """
+        shift = self._shift_for(g)
+        self._add_shifted(g, shift)
+        # New lists: the old ones may be shared with a copy
+        self.set_inputs(self.inputs + [i + shift for i in g.inputs])
+        self.set_outputs(self.outputs + [o + shift for o in g.outputs])
+        return shift
+
+    def parallel(self, g):
+        """
+        Returns the disjoint union of self and g, see iparallel
+        """
+        result = self.copy()
+        result.iparallel(g)
+        return result
+
+    @_grouped
+    def icompose(self, f):
+        """
+        Sequential composition, in place: a copy of f is put before self and
+        the i-th output of f is linked to the i-th input of self. The result has the
+        inputs of f and the outputs of self. Works in O(size of f); f may be self.
+        Raises a ValueError if f doesn't have as many outputs as self has inputs.
+        Returns the shift applied to the ids of f.
+        """
+        if len(f.outputs) != len(self.inputs):
+            raise ValueError(f"{len(f.outputs)} outputs can't be plugged into {len(self.inputs)} inputs")
+        shift = self._shift_for(f)
+        self._add_shifted(f, shift)
+        for output_id, input_id in zip(f.outputs, self.inputs):
+            self.add_edge(output_id + shift, input_id)
+        self.set_inputs([i + shift for i in f.inputs])
+        return shift
+
+    def compose(self, f):
+        """
+        Returns self after f, see icompose
+        """
+        result = self.copy()
+        result.icompose(f)
+        return result
+
     @classmethod
-    def random(cls, n, bound, inputs=0, outputs=0, form="free"):
-        # Generate a matrix based on the form argument
-        if form == "free":
-            m = random_int_matrix(n, bound)
-        elif form == "DAG":
-            m = random_int_matrix(n, bound, dag=True)
-        elif form == "oriented":
-            m = random_int_matrix(n, bound)
-        elif form == "loop-free":
-            m = random_int_matrix(n, bound)
-            m = non_cyclic_int_matrix(n, m)
-        elif form == "undirected":
-            m = random_int_matrix(n, bound, symmetric=True)
-        elif form == "loop-free undirected":
-            m = random_int_matrix(n, bound, symmetric=True, null_diag=True)
+    def random(cls, n, bound, inputs=0, outputs=0, form="free", density=None, seed=None):
+        """
+        Random graph with n nodes and edge multiplicities up to bound, plus inputs and
+        outputs pointing to / from random nodes.
+        form: "free", "DAG", "oriented", "loop-free", "undirected" or "loop-free undirected"
+        density: if given, the edges are sampled directly with this probability per
+                 cell (see random_sparse_int_coo) instead of filling an n x n matrix
+        seed: int or generator, see random_generator
+        """
+        rng = random_generator(seed)
+        if density is not None:
+            coo = random_sparse_int_coo(n, bound, density, form, rng)
+            graph = graph_from_adjacency_matrix(coo, format="coo", size=n)
         else:
-            raise ValueError("Unknown form")
+            # Generate a matrix based on the form argument
+            if form == "free":
+                m = random_int_matrix(n, bound, seed=rng)
+            elif form == "DAG":
+                m = random_int_matrix(n, bound, null_diag=True, dag=True, seed=rng)
+            elif form == "oriented":
+                m = random_int_matrix(n, bound, null_diag=True, oriented=True, seed=rng)
+            elif form == "loop-free":
+                m = random_int_matrix(n, bound, null_diag=True, seed=rng)
+            elif form == "undirected":
+                m = random_int_matrix(n, bound, symmetric=True, seed=rng)
+            elif form == "loop-free undirected":
+                m = random_int_matrix(n, bound, symmetric=True, null_diag=True, seed=rng)
+            else:
+                raise ValueError("Unknown form")
 
-        # Transform the matrix into a graph
-        graph = graph_from_adjacency_matrix(m)
+            # Transform the matrix into a graph
+            graph = graph_from_adjacency_matrix(m)
 
         # Add inputs and outputs
-        for i in range(inputs):
-            n_id = graph.new_id()
-            graph.add_input_id(n_id)
-        for i in range(outputs):
-            n_id = graph.new_id()
-            graph.add_output(n_id)
+        node_ids = graph.get_node_ids()
+        if node_ids:
+            for i in range(inputs):
+                graph.add_input_node(node_ids[_randrange(rng, len(node_ids))])
+            for i in range(outputs):
+                graph.add_output_node(node_ids[_randrange(rng, len(node_ids))])
         return graph
 
+    def _topological_layers(self):
+        """
+        Kahn's algorithm, cached until the next mutation.
+        Returns (layers, depths, remaining): the layers of the sort, the depth of each
+        sorted node and the ids left over because they are on or after a cycle
+        """
+        if 'topological' in self._cache:
+            return self._cache['topological']
+        # Number of distinct parents not sorted yet
+        pending = {node_id: len(n.parents) for node_id, n in self.nodes.items()}
+        layer = [node_id for node_id, count in pending.items() if count == 0]
+        layers = []
+        depths = {}
+        while layer:
+            layers.append(layer)
+            next_layer = []
+            for node_id in layer:
+                depths[node_id] = len(layers) - 1
+                for child_id in self.nodes[node_id].children:
+                    pending[child_id] -= 1
+                    if pending[child_id] == 0:
+                        next_layer.append(child_id)
+            layer = next_layer
+        remaining = [node_id for node_id in self.nodes if node_id not in depths]
+        self._cache['topological'] = layers, depths, remaining
+        return layers, depths, remaining
+
+    def topological_sort(self):
+        """
+        Returns the nodes sorted by layers: the first layer holds the nodes without
+        parents, each next one the nodes whose parents are all in the previous layers.
+        Raises a ValueError if the graph is cyclic
+        """
+        layers, _, remaining = self._topological_layers()
+        if remaining:
+            raise ValueError("The graph is cyclic")
+        return [layer.copy() for layer in layers]
+
+    def node_depth(self, node_id):
+        """
+        Index of the layer of node_id in the topological sort
+        """
+        if node_id not in self.nodes:
+            raise ValueError(f"{node_id} not in the graph")
+        _, depths, remaining = self._topological_layers()
+        if remaining:
+            raise ValueError("The graph is cyclic")
+        return depths[node_id]
+
+    def graph_depth(self):
+        """
+        Number of layers of the topological sort
+        """
+        return len(self.topological_sort())
+
+    def is_cyclic(self):
+        """
+        Returns a cycle of the graph as a list of ids [v0, ..., vk] (with edges
+        v0 -> v1 -> ... -> vk -> v0), or None if the graph is acyclic
+        """
+        _, _, remaining = self._topological_layers()
+        if not remaining:
+            return None
+        # Every node left by Kahn's algorithm has a parent that was left too:
+        # going up through such parents must loop
+        left = set(remaining)
+        seen = {}
+        path = []
+        node_id = remaining[0]
+        while node_id not in seen:
+            seen[node_id] = len(path)
+            path.append(node_id)
+            node_id = next(p for p in self.nodes[node_id].parents if p in left)
+        cycle = path[seen[node_id]:]
+        cycle.reverse()
+        return cycle
+
+    def connected_components(self):
+        """
+        Numbers the connected components of the graph (edges taken in both directions)
+        from 0, in the order of self.nodes.
+        Returns a dict mapping each node id to its component.
+        """
+        sets = union_find(self.nodes)
+        for node_id, n in self.nodes.items():
+            for child_id in n.children:
+                sets.union(node_id, child_id)
+        numbers = {}
+        components = {}
+        for node_id in self.nodes:
+            components[node_id] = numbers.setdefault(sets.find(node_id), len(numbers))
+        return components
+
+    def split_components(self):
+        """
+        Yields one open_digraph per connected component, with the inputs and outputs of
+        the component in the same order as in self. Each node is copied once, nothing
+        else of the graph is.
+        """
+        components = self.connected_components()
+        groups = [[] for _ in range(max(components.values(), default=-1) + 1)]
+        for node_id, n in self.nodes.items():
+            groups[components[node_id]].append(n.copy())
+        inputs = [[] for _ in groups]
+        outputs = [[] for _ in groups]
+        for i in self.inputs:
+            inputs[components[i]].append(i)
+        for o in self.outputs:
+            outputs[components[o]].append(o)
+        for nodes, ins, outs in zip(groups, inputs, outputs):
+            yield open_digraph(ins, outs, nodes)
+
+    def _path_buffers(self, direction):
+        """
+        Data reused by every path query in this direction until the next mutation:
+        the ids in dic_nodes order, the neighbours of each index as indices, and the
+        distance and predecessor arrays, left filled with None between queries
+        """
+        key = ('paths', direction)
+        if key in self._cache:
+            return self._cache[key]
+        index = self.dic_nodes()
+        ids = list(self.nodes)
+        neighbours = []
+        for n in self.nodes.values():
+            row = []
+            if direction != -1:
+                row.extend(index[child_id] for child_id in n.children)
+            if direction != 1:
+                row.extend(index[parent_id] for parent_id in n.parents)
+            neighbours.append(row)
+        buffers = index, ids, neighbours, [None] * len(ids), [None] * len(ids)
+        self._cache[key] = buffers
+        return buffers
+
+    def dijkstra(self, src, direction=None, tgt=None, weight=None):
+        """
+        Distances from src, each edge counting once whatever its multiplicity.
+        direction: 1 to follow children, -1 to follow parents, None for both
+        tgt: stop as soon as the distance to tgt is known (others may then be too big)
+        weight: function (a, b) -> length of a step from a to b, 1 by default
+        Returns (dist, prev): dicts mapping each reached id to its distance and to the
+        id before it on a shortest path (src has no entry in prev)
+        """
+        if src not in self.nodes:
+            raise ValueError(f"{src} not in the graph")
+        index, ids, neighbours, dist, prev = self._path_buffers(direction)
+        start = index[src]
+        stop = index.get(tgt)
+        dist[start] = 0
+        reached = [start]
+        heap = [(0, start)]
+        try:
+            while heap:
+                d, i = heapq.heappop(heap)
+                if d > dist[i]:
+                    continue # Already settled with a smaller distance
+                if i == stop:
+                    break
+                for j in neighbours[i]:
+                    new = d + 1 if weight is None else d + weight(ids[i], ids[j])
+                    if dist[j] is None:
+                        reached.append(j)
+                    elif new >= dist[j]:
+                        continue
+                    dist[j] = new
+                    prev[j] = i
+                    heapq.heappush(heap, (new, j))
+            distances = {ids[i]: dist[i] for i in reached}
+            predecessors = {ids[i]: ids[prev[i]] for i in reached if i != start}
+        finally:
+            # Only the reached entries were written, so the reset is as cheap as the search
+            for i in reached:
+                dist[i] = None
+                prev[i] = None
+        return distances, predecessors
+
+    def shortest_path(self, u, v, direction=1, weight=None):
+        """
+        Returns the ids of a shortest path from u to v (both included), None if v
+        can't be reached from u
+        """
+        if v not in self.nodes:
+            raise ValueError(f"{v} not in the graph")
+        dist, prev = self.dijkstra(u, direction, tgt=v, weight=weight)
+        if v not in dist:
+            return None
+        path = [v]
+        while path[-1] != u:
+            path.append(prev[path[-1]])
+        path.reverse()
+        return path
+
+    def distances_from(self, sources=None, direction=1, weight=None):
+        """
+        Returns a dict mapping each source (the inputs by default) to its dict of
+        distances, as given by dijkstra
+        """
+        if sources is None:
+            sources = self.inputs
+        return {src: self.dijkstra(src, direction, weight=weight)[0] for src in sources}
+
+    def build_reachability_index(self, method="bitset"):
+        """
+        Precomputes the answers of reachable and common_ancestors (see reachability_index).
+        Adding nodes or edges patches a bitset index, other edge changes drop it.
+        Raises a ValueError if the graph is cyclic.
+        """
+        self._reach = reachability_index(self, method)
+        return self._reach
+
+    def reachable(self, u, v):
+        """
+        True if there is a path from u to v. Builds a bitset index if there is none.
+        """
+        if self._reach is None:
+            self.build_reachability_index()
+        return self._reach.reachable(u, v)
+
+    def common_ancestors(self, u, v):
+        """
+        Set of the ids with a path to both u and v (a node has a path to itself).
+        Builds a bitset index if there is none.
+        """
+        if self._reach is None:
+            self.build_reachability_index()
+        return self._reach.common_ancestors(u, v)
+
     def dic_nodes(self):
         """
         Method to assign a unique integer (0 to n-1) to each node ID in the graph.
@@ -369,93 +1796,180 @@ class open_digraph: # for open directed graph
         return {node_id: i for i, node_id in enumerate(self.nodes)}
 
 
-    def adjacency_matrix(self):
+    def adjacency_matrix(self, format="dense"):
         """
-        Generates the adjacency matrix of a graph
+        Generates the adjacency matrix of a graph, rows and columns ordered as in dic_nodes
+        format: "dense": list of lists
+                "numpy": numpy array (needs numpy)
+                "coo": (rows, cols, values) lists, one entry per non null cell
+                "csr": (indptr, indices, values) lists, the non null cells of row i
+                       are indices[indptr[i]:indptr[i+1]], sorted by column
+        "coo" and "csr" are built in time proportional to the number of edges.
         """
         id_dic = self.dic_nodes()
-
         size = len(self.nodes)
-        m = [[0 for _ in range(size)] for _ in range(size)] # Matrix filled with 0s
 
-        # Fill the matrix based on the graph
+        if format == "dense":
+            m = [[0 for _ in range(size)] for _ in range(size)] # Matrix filled with 0s
+            # Fill the matrix based on the graph
+            for node_id, node in self.nodes.items():
+                for child_id, multiplicity in node.children.items():
+                    if child_id in self.nodes:
+                        m[id_dic[node_id]][id_dic[child_id]] = multiplicity
+            return m
+
+        if format == "numpy":
+            if np is None:
+                raise ImportError('adjacency_matrix(format="numpy") needs numpy')
+            rows, cols, values = self.adjacency_matrix("coo")
+            m = np.zeros((size, size), dtype=np.int64)
+            m[rows, cols] = values
+            return m
+
+        if format == "coo":
+            rows, cols, values = [], [], []
+            for node_id, node in self.nodes.items():
+                i = id_dic[node_id]
+                for child_id, multiplicity in node.children.items():
+                    if child_id in id_dic:
+                        rows.append(i)
+                        cols.append(id_dic[child_id])
+                        values.append(multiplicity)
+            return rows, cols, values
+
+        if format == "csr":
+            indptr, indices, values = [0], [], []
+            for node in self.nodes.values():
+                row = sorted((id_dic[child_id], multiplicity)
+                             for child_id, multiplicity in node.children.items()
+                             if child_id in id_dic)
+                for j, multiplicity in row:
+                    indices.append(j)
+                    values.append(multiplicity)
+                indptr.append(len(indices))
+            return indptr, indices, values
+
+        raise ValueError(f"Unknown matrix format {format}")
+    
+    def save_binary(self, path):
+        """
+        Saves the graph in the binary snapshot format of compact_digraph:
+        ids, labels in a string pool, CSR adjacency with multiplicities, inputs and outputs
+        """
+        from modules.compact_digraph import compact_digraph # imports this module
+        compact_digraph.from_open_digraph(self).save_binary(path)
+
+    @classmethod
+    def load_binary(cls, path, lazy=False):
+        """
+        Loads a graph saved with save_binary.
+        lazy: return the memory mapped compact_digraph instead, where nodes are
+              only built when asked for (get_node_by_id, to_open_digraph)
+        """
+        from modules.compact_digraph import compact_digraph # imports this module
+        graph = compact_digraph.load_binary(path)
+        if lazy:
+            return graph
+        return graph.to_open_digraph()
+
+    def write_dot(self, stream, verbose=False, collapse=False, chunk_size=4096):
+        """
+        Writes the graph in DOT format to a text stream.
+        verbose: include the id of each node in its label
+        collapse: write parallel edges once, with a multiplicity attribute
+                  (read back by from_dot_file), instead of once per edge
+        chunk_size: number of lines gathered before each write
+        """
+        chunk = ['digraph G {\n']
         for node_id, node in self.nodes.items():
+            label = f'{node_id}: {node.label}' if verbose else node.label
+            chunk.append(f'    {_dot_quote_id(node_id)} [label="{_dot_escape(label)}"];\n')
+            if len(chunk) >= chunk_size:
+                stream.write(''.join(chunk))
+                chunk.clear()
+
+        for node_id, node in self.nodes.items():
+            src = _dot_quote_id(node_id)
             for child_id, multiplicity in node.children.items():
-                if child_id in self.nodes:
-                    m[id_dic[node_id]][id_dic[child_id]] = multiplicity
-        return m
-    
-    #CAMBIAR 
-    def save_as_dot_file(self, path: str, verbose=False):
+                if collapse and multiplicity > 1:
+                    chunk.append(f'    {src} -> {_dot_quote_id(child_id)} [multiplicity={multiplicity}];\n')
+                else:
+                    edge = f'    {src} -> {_dot_quote_id(child_id)};\n'
+                    # One string for all the parallel edges
+                    chunk.append(edge * (1 if collapse else multiplicity))
+            if len(chunk) >= chunk_size:
+                stream.write(''.join(chunk))
+                chunk.clear()
+        chunk.append('}\n')
+        stream.write(''.join(chunk))
+
+    def to_dot_string(self, verbose=False, collapse=False):
+        """
+        Returns the DOT representation of the graph, see write_dot
+        """
+        buffer = io.StringIO()
+        self.write_dot(buffer, verbose, collapse)
+        return buffer.getvalue()
+
+    def save_as_dot_file(self, path: str, verbose=False, collapse=False):
         """
         Creates a file .dot, which has the graph
         """
         with open(path, 'w') as f: 
-            f.write('digraph G {\n')
-            # Write nodes with labels. If verbose is True, include the ID in the label.
-            for node_id, node in self.nodes.items():
-                if verbose:
-                    f.write(f'{node_id} [label="{node_id}: {node.label}"];\n')
-                else:
-                    f.write(f'{node_id} [label="{node.id}"];\n')
-
-            # Write edges
-            for node_id, node in self.nodes.items():
-                for child_id, multiplicity in node.children.items():
-                    for _ in range(multiplicity):
-                        f.write(f'    {node_id} -> {child_id};\n')
-            f.write('}\n')
+            self.write_dot(f, verbose, collapse)
     
     @classmethod
     def from_dot_file(cls, path):
-        # Create an empty graph instance
-        graph = cls.empty()
-
-        # Regular expressions to match nodes and edges
-        node_pattern = re.compile(r'\s*(\S+)\s*\[label="([^"]+)"\];')
-        edge_pattern = re.compile(r'\s*(\S+)\s*->\s*(\S+);')
-
-        with open(path, 'r') as f:
-            for line in f:
-                # Check for a node definition
-                node_match = node_pattern.match(line)
-                if node_match:
-                    node_id, label = node_match.groups()
-                    # Convert node_id to int if possible
-                    try:
-                        node_id = int(node_id)
-                    except ValueError:
-                        pass  # Keep node_id as string if it cannot be converted
-                    graph.add_node(label=label)
-                    continue
-                
-                # Check for an edge definition
-                edge_match = edge_pattern.match(line)
-                if edge_match:
-                    src, tgt = edge_match.groups()
-                    # Convert src and tgt to int if possible
-                    try:
-                        src = int(src)
-                        tgt = int(tgt)
-                    except ValueError:
-                        pass  # Keep src and tgt as string if they cannot be converted
-                    graph.add_edge(src, tgt)
+        """
+        Reads a graph from a .dot file, in a single streaming pass.
+        path: a path, or any text/binary source with readline (open file, StringIO, mmap...)
+        Node ids of the file are kept (converted to int when possible). Edges may come
+        before their nodes, several statements may share a line and a -> b -> c chains
+        are read as two edges. Raises a ValueError on subgraphs used as edge ends
+        (a -> {b c}), which are not supported.
+        """
+        if isinstance(path, (str, os.PathLike)):
+            with open(path, 'r') as f:
+                return cls._from_dot_statements(_dot_statements(_dot_lines(f)))
+        return cls._from_dot_statements(_dot_statements(_dot_lines(path)))
 
+    @classmethod
+    def _from_dot_statements(cls, statements):
+        graph = cls.empty()
+        nodes = graph.nodes
+
+        def get_node(node_id):
+            # Nodes first seen in an edge are created on the fly, their label comes later
+            n = nodes.get(node_id)
+            if n is None:
+                n = nodes[node_id] = node(node_id, '', {}, {})
+            return n
+
+        for ids, attributes in statements:
+            ids = [_dot_id(i) for i in ids]
+            if len(ids) == 1:
+                n = get_node(ids[0])
+                if 'label' in attributes:
+                    n.label = attributes['label']
+                continue
+            # Parallel edges may have been collapsed by write_dot
+            multiplicity = attributes.get('multiplicity', '1')
+            if not multiplicity.isdecimal() or int(multiplicity) < 1:
+                raise ValueError(f"Invalid edge multiplicity {multiplicity!r}")
+            multiplicity = int(multiplicity)
+            for src, tgt in zip(ids, ids[1:]):
+                src_node = get_node(src)
+                tgt_node = get_node(tgt)
+                src_node.add_child_id(tgt, multiplicity)
+                tgt_node.add_parent_id(src, multiplicity)
+
+        graph._reset_id_allocator()
+        graph._recount()
         return graph
     
     def display(self, verbose=False):
         # Generate the .dot representation as a string
-        dot_str = 'digraph G {\n'
-        for node_id, node in self.nodes.items():
-            if verbose:
-                dot_str += f'    {node_id} [label="{node_id}: {node.label}"];\n'
-            else:
-                dot_str += f'    {node_id} [label="{node.label}"];\n'
-        for node_id, node in self.nodes.items():
-            for child_id, multiplicity in node.children.items():
-                for _ in range(multiplicity):
-                    dot_str += f'    {node_id} -> {child_id};\n'
-        dot_str += '}'
+        dot_str = self.to_dot_string(verbose)
 
         # Encode the .dot string for URL use
         encoded_dot = quote(dot_str)  # Use the imported quote function
@@ -470,8 +1984,43 @@ class open_digraph: # for open directed graph
 
 ################# END CLASS ##########################
 
-def random_int_list(n, bound):
-    return [random.randint(0, bound) for _ in range(n)]
+def random_generator(seed=None):
+    """
+    Returns the random generator used by the functions below: a numpy.random.Generator
+    if numpy is installed, a random.Random otherwise.
+    seed: None, an int, or a generator that is returned as is
+    """
+    if isinstance(seed, random.Random) or (np is not None and isinstance(seed, np.random.Generator)):
+        return seed
+    if np is not None:
+        return np.random.default_rng(seed)
+    return random.Random(seed)
+
+def _randrange(rng, n):
+    """
+    Random integer between 0 and n-1 for both kinds of generator
+    """
+    if isinstance(rng, random.Random):
+        return rng.randrange(n)
+    return int(rng.integers(n))
+
+def _random_array(n, bound, rng):
+    """
+    n x n numpy array of integers between 0 and bound
+    """
+    return rng.integers(0, bound + 1, size=(n, n))
+
+def _random_list_matrix(n, bound, rng):
+    """
+    Same as _random_array without numpy
+    """
+    return [[rng.randint(0, bound) for _ in range(n)] for _ in range(n)]
+
+def random_int_list(n, bound, seed=None):
+    rng = random_generator(seed)
+    if not isinstance(rng, random.Random):
+        return rng.integers(0, bound + 1, size=n).tolist()
+    return [rng.randint(0, bound) for _ in range(n)]
 
 
 def random_null_diag_int_matrix(n : int, l: list):
@@ -483,11 +2032,18 @@ def random_null_diag_int_matrix(n : int, l: list):
     return l
 
 
-def random_symmetric_int_matrix(n, bound, null_diag=True):
+def random_symmetric_int_matrix(n, bound, null_diag=True, seed=None):
     """
     Renvoie une matrice symetrique avec option de diagonale nulle
     """
-    m = random_int_matrix(n, bound)
+    rng = random_generator(seed)
+    if not isinstance(rng, random.Random):
+        m = np.triu(_random_array(n, bound, rng))
+        m = m + np.triu(m, 1).T
+        if null_diag:
+            np.fill_diagonal(m, 0)
+        return m.tolist()
+    m = _random_list_matrix(n, bound, rng)
     for i in range(n):
         for j in range(n):
             if i > j:
@@ -496,28 +2052,42 @@ def random_symmetric_int_matrix(n, bound, null_diag=True):
         return random_null_diag_int_matrix(n, m)
     return m
 
-def non_cyclic_int_matrix(n: int, null_diag=True):
-    for i in range(n):
-        for j in range(n):
-            if j > i and m[i][j] != 0:
-                m[j][i] = 0
-    return m
-
-def random_oriented_int_matrix(n: int, bound: int, null_diag=True):
-    m = random_int_matrix(n, bound, null_diag)
+def non_cyclic_int_matrix(n: int, m: list):
+    """
+    Modifie la matrice en parametre: m[j][i] devient nul si m[i][j] ne l'est pas (i < j)
+    """
     for i in range(n):
         for j in range(n):
             if j > i and m[i][j] != 0:
                 m[j][i] = 0
     return m
 
-def random_dag_int_matrix(n, bound, null_diag=True):
+def random_oriented_int_matrix(n: int, bound: int, null_diag=True, seed=None):
+    rng = random_generator(seed)
+    if not isinstance(rng, random.Random):
+        m = _random_array(n, bound, rng)
+        lower = np.tril(m, -1)
+        lower[np.triu(m, 1).T != 0] = 0
+        m = np.triu(m) + lower
+        if null_diag:
+            np.fill_diagonal(m, 0)
+        return m.tolist()
+    m = _random_list_matrix(n, bound, rng)
+    if null_diag:
+        random_null_diag_int_matrix(n, m)
+    return non_cyclic_int_matrix(n, m)
+
+def random_dag_int_matrix(n, bound, null_diag=True, seed=None):
+    rng = random_generator(seed)
+    if not isinstance(rng, random.Random):
+        # Up right, diagonal included unless null_diag
+        return np.triu(_random_array(n, bound, rng), 1 if null_diag else 0).tolist()
     m = []
     for i in range(n):
         l = []
         for j in range(n):
             if j >= i: # Up right (diagonal included) 
-                l.append(random.randint(0, bound))
+                l.append(rng.randint(0, bound))
             else:
                 l.append(0)
         m.append(l)
@@ -525,34 +2095,322 @@ def random_dag_int_matrix(n, bound, null_diag=True):
         return random_null_diag_int_matrix(n, m)
     return m
 
-def random_int_matrix(n, bound, null_diag=False, symmetric=False, oriented=False, dag=False):
-    m = []
+def random_int_matrix(n, bound, null_diag=False, symmetric=False, oriented=False, dag=False, seed=None):
     if symmetric:
-        return random_symmetric_int_matrix(n, null_diag)
+        return random_symmetric_int_matrix(n, bound, null_diag, seed)
     elif oriented:
-        return random_oriented_int_matrix(n, bound, null_diag)
+        return random_oriented_int_matrix(n, bound, null_diag, seed)
     elif dag:
-        return random_dag_int_matrix(n, bound, null_diag)
-    else:
-        for i in range(n):
-            m.append(random_int_list(n, bound))
+        return random_dag_int_matrix(n, bound, null_diag, seed)
+    rng = random_generator(seed)
+    if not isinstance(rng, random.Random):
+        m = _random_array(n, bound, rng)
         if null_diag:
-            return random_null_diag_int_matrix(n, m)
-        return m
-
-def graph_from_adjacency_matrix(m: list[list[int]]):
-    graph = open_digraph() # Initialise an empty graph graph
-
-    nodes_list = [] # List with all nodes ids
-    for i in range(len(m)): 
-        node_id = graph.add_node() # Add each node to the graph
-        nodes_list.append(node_id)
-
-    for i in range(len(m)):
-        for j in range(len(m)):
-            edges = m[i][j]
-            for _ in range(edges):
-                graph.add_edge(nodes_list[i], nodes_list[j])
+            np.fill_diagonal(m, 0)
+        return m.tolist()
+    m = _random_list_matrix(n, bound, rng)
+    if null_diag:
+        return random_null_diag_int_matrix(n, m)
+    return m
+
+def random_sparse_int_coo(n, bound, density, form="free", seed=None):
+    """
+    Samples the edges of a random graph directly, without building the n x n matrix.
+    Each allowed cell of the matrix holds an edge with probability density, with a
+    multiplicity between 1 and bound. form: same values as open_digraph.random
+    Returns a (rows, cols, values) COO matrix (see open_digraph.adjacency_matrix).
+    Needs numpy.
+    """
+    if np is None:
+        raise ImportError("random_sparse_int_coo needs numpy")
+    rng = random_generator(seed)
+    if isinstance(rng, random.Random):
+        rng = np.random.default_rng(rng.getrandbits(64))
+
+    loops = form in ("free", "undirected")
+    # Forms where a cell and its mirror can't both hold an edge: sample unordered pairs
+    pairs = form in ("DAG", "oriented", "undirected", "loop-free undirected")
+    if form not in ("free", "loop-free", "DAG", "oriented", "undirected", "loop-free undirected"):
+        raise ValueError("Unknown form")
+
+    if pairs:
+        cells = n * (n + 1) // 2 if loops else n * (n - 1) // 2
+    else:
+        cells = n * n if loops else n * (n - 1)
+    k = int(rng.binomial(cells, density)) if cells and bound > 0 else 0
+
+    if 2 * k > cells:
+        # Dense: pick k of the allowed cells, listed in full (the result is as big)
+        if pairs:
+            rows, cols = np.triu_indices(n, 0 if loops else 1)
+        else:
+            rows, cols = np.divmod(np.arange(n * n, dtype=np.int64), n)
+            if not loops:
+                keep = rows != cols
+                rows, cols = rows[keep], cols[keep]
+        keys = np.sort(rng.choice(cells, size=k, replace=False))
+        rows, cols = rows[keys].astype(np.int64), cols[keys].astype(np.int64)
+    else:
+        # Draw cells until k distinct ones are found: at most half of the cells are
+        # wanted, so each round finds at least half of the missing ones on average
+        found = set()
+        while len(found) < k:
+            rows = rng.integers(0, n, size=k - len(found), dtype=np.int64)
+            cols = rng.integers(0, n, size=k - len(found), dtype=np.int64)
+            if not loops:
+                keep = rows != cols
+                rows, cols = rows[keep], cols[keep]
+            if pairs:
+                rows, cols = np.minimum(rows, cols), np.maximum(rows, cols)
+            found.update((rows * n + cols).tolist())
+        keys = np.array(sorted(found), dtype=np.int64)
+        rows, cols = keys // n, keys % n
+    values = rng.integers(1, bound + 1, size=k) if k else np.empty(0, dtype=np.int64)
+    if form == "oriented":
+        # Each pair gets a random direction
+        flip = rng.random(k) < 0.5
+        rows, cols = np.where(flip, cols, rows), np.where(flip, rows, cols)
+    elif form in ("undirected", "loop-free undirected"):
+        mirror = rows != cols
+        rows, cols = np.concatenate([rows, cols[mirror]]), np.concatenate([cols, rows[mirror]])
+        values = np.concatenate([values, values[mirror]])
+    return rows.tolist(), cols.tolist(), values.tolist()
+
+_DOT_TOKEN = re.compile(r"""
+    \s*(?:
+        (?P<string>"(?:[^"\\]|\\.)*")
+      | (?P<edge>->|--)
+      | (?P<punct>[\[\]{};,=])
+      | (?P<id>-?(?:\.[0-9]+|[0-9]+(?:\.[0-9]*)?)|[A-Za-z_\x80-\uffff][A-Za-z_0-9\x80-\uffff]*)
+      | (?P<comment>//.*|\#.*)
+      | (?P<block>/\*)
+    )""", re.VERBOSE)
+
+_DOT_PLAIN_ID = r'(-?(?:\.[0-9]+|[0-9]+(?:\.[0-9]*)?)|[A-Za-z_][A-Za-z_0-9]*)'
+
+# Lines holding a single "a -> b;" or "a [label="..."];" statement, as written by write_dot
+_DOT_SIMPLE_STATEMENT = re.compile(r'\s*' + _DOT_PLAIN_ID + r'\s*(?:->\s*' + _DOT_PLAIN_ID
+                                   + r'\s*)?(?:\[label="((?:[^"\\]|\\.)*)"\]\s*)?;\s*$')
+
+_DOT_KEYWORDS = {'strict', 'graph', 'digraph', 'subgraph', 'node', 'edge'}
+
+def _dot_lines(source):
+    """
+    Yields the lines of a text or binary source one at a time, as strings
+    """
+    while True:
+        line = source.readline()
+        if not line:
+            return
+        if isinstance(line, bytes):
+            line = line.decode()
+        yield line
+
+def _dot_tokens(line, in_comment):
+    """
+    Splits a DOT line into (kind, text) tokens, skipping comments.
+    in_comment: the line starts inside a /* */ comment
+    Returns the tokens and whether the line ends inside a comment.
+    """
+    tokens = []
+    pos = 0
+    end = len(line)
+    while pos < end:
+        if in_comment:
+            close = line.find('*/', pos)
+            if close < 0:
+                break
+            pos = close + 2
+            in_comment = False
+            continue
+        match = _DOT_TOKEN.match(line, pos)
+        if match is None or match.end() == pos:
+            if line[pos:].strip():
+                raise ValueError(f"Unexpected DOT syntax: {line[pos:].strip()}")
+            break
+        pos = match.end()
+        kind = match.lastgroup
+        if kind == 'block':
+            in_comment = True
+        elif kind != 'comment':
+            tokens.append((kind, match.group(kind)))
+    return tokens, in_comment
+
+_DOT_ESCAPED = re.compile(r'\\(["\\n])')
+_DOT_UNESCAPED = {'"': '"', '\\': '\\', 'n': '\n'}
+
+def _dot_unquote(text):
+    if text.startswith('"'):
+        return _DOT_ESCAPED.sub(lambda match: _DOT_UNESCAPED[match.group(1)], text[1:-1])
+    return text
+
+def _dot_escape(text):
+    # Backslashes first, so that the ones added before quotes are not doubled.
+    # Newlines too: the reader goes line by line
+    return str(text).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _dot_quote_id(node_id):
+    """
+    Writes a node id as a DOT id, quoted when it is not a plain name or number
+    """
+    text = str(node_id)
+    match = _DOT_TOKEN.match(text)
+    if match and match.lastgroup == 'id' and match.end() == len(text) and text == text.strip():
+        return text
+    return f'"{_dot_escape(text)}"'
+
+def _dot_id(text):
+    # Convert node ids to int if possible, keep them as strings otherwise
+    try:
+        return int(text)
+    except ValueError:
+        return text
+
+def _dot_statements(lines):
+    """
+    Yields the node and edge statements of a DOT source as (ids, attributes):
+    one id for a node statement, the whole chain for an edge statement.
+    Graph headers, subgraph braces, graph attributes and default
+    node/edge/graph attributes are skipped.
+    """
+    ids = []          # ids of the statement being read
+    attributes = {}
+    pending_edge = False # an edge operator is waiting for its target
+    assignment = False   # statement of the form key = value
+    in_attributes = False
+    in_comment = False
+    key = None
+    expect_value = False
+
+    def statement():
+        if ids and not assignment and ids[0].lower() not in _DOT_KEYWORDS:
+            return ids, attributes
+        return None
+
+    for line in lines:
+        if not (ids or in_attributes or in_comment or pending_edge or assignment):
+            # Fast path for the lines written by write_dot, when no statement is open
+            match = _DOT_SIMPLE_STATEMENT.match(line)
+            if match and match.group(1).lower() not in _DOT_KEYWORDS:
+                src, tgt, label = match.groups()
+                found = {} if label is None else {'label': _dot_unquote(f'"{label}"')}
+                yield ([src] if tgt is None else [src, tgt]), found
+                continue
+
+        tokens, in_comment = _dot_tokens(line, in_comment)
+        for kind, text in tokens:
+            if in_attributes:
+                if text == ']':
+                    in_attributes = False
+                elif text == '=':
+                    expect_value = True
+                elif kind in ('id', 'string'):
+                    if expect_value:
+                        attributes[key] = _dot_unquote(text)
+                        expect_value = False
+                    else:
+                        key = _dot_unquote(text)
+                continue
+
+            if kind in ('id', 'string'):
+                text = _dot_unquote(text)
+                if pending_edge:
+                    ids.append(text)
+                    pending_edge = False
+                elif assignment:
+                    # Value of a graph attribute, ends the statement
+                    ids, attributes, assignment = [], {}, False
+                else:
+                    # A new statement starts without a ';'
+                    done = statement()
+                    if done:
+                        yield done
+                    ids, attributes = [text], {}
+            elif kind == 'edge':
+                if not ids or pending_edge:
+                    # After a '}': a subgraph as the source of the edge
+                    raise ValueError(f"Unsupported DOT edge: nothing before {text}")
+                pending_edge = True
+            elif text == '[':
+                in_attributes = True
+            elif text == '=':
+                assignment = True
+            elif text in (';', '}', '{'):
+                if pending_edge:
+                    raise ValueError(f"Unsupported DOT edge: {text} after an edge operator")
+                # '{' follows a graph or subgraph header, which is not a statement
+                done = statement() if text != '{' else None
+                if done:
+                    yield done
+                ids, attributes, pending_edge, assignment = [], {}, False, False
+    done = statement()
+    if done:
+        yield done
+
+def structural_key(label, parents):
+    """
+    Key identifying a gate by its label and its parents with their multiplicities
+    """
+    return label, frozenset(parents.items())
+
+def _count_edges(edges):
+    """
+    Turns an edge iterable (see open_digraph.add_edges_bulk) into two
+    multiplicity maps: src -> {tgt: m} and tgt -> {src: m}
+    """
+    if isinstance(edges, dict):
+        edges = ((src, tgt, m) for (src, tgt), m in edges.items())
+    children_maps = {}
+    parents_maps = {}
+    for edge in edges:
+        if len(edge) == 2:
+            src, tgt = edge
+            multiplicity = 1
+        else:
+            src, tgt, multiplicity = edge
+            if multiplicity < 0:
+                raise ValueError(f"Negative multiplicity for edge {src} -> {tgt}")
+            if multiplicity == 0:
+                continue
+        counts = children_maps.setdefault(src, {})
+        counts[tgt] = counts.get(tgt, 0) + multiplicity
+        counts = parents_maps.setdefault(tgt, {})
+        counts[src] = counts.get(src, 0) + multiplicity
+    return children_maps, parents_maps
+
+def graph_from_adjacency_matrix(m, format="dense", size=None):
+    """
+    Builds a graph from a matrix in one of the formats of open_digraph.adjacency_matrix.
+    size: number of nodes for the "coo" format; by default the biggest index + 1
+    "numpy", "coo" and "csr" matrices are read in time proportional to the number of edges.
+    """
+    if format == "dense":
+        size = len(m)
+        triples = ((i, j, edges) for i, row in enumerate(m)
+                   for j, edges in enumerate(row) if edges)
+    elif format == "numpy":
+        size = len(m)
+        rows, cols = m.nonzero()
+        triples = zip(rows.tolist(), cols.tolist(), m[rows, cols].tolist())
+    elif format == "coo":
+        rows, cols, values = m
+        if size is None:
+            size = max(max(rows, default=-1), max(cols, default=-1)) + 1
+        triples = zip(rows, cols, values)
+    elif format == "csr":
+        indptr, indices, values = m
+        size = len(indptr) - 1
+        triples = ((i, indices[k], values[k]) for i in range(size)
+                   for k in range(indptr[i], indptr[i + 1]))
+    else:
+        raise ValueError(f"Unknown matrix format {format}")
+
+    graph = open_digraph.empty() # Initialise an empty graph graph
+
+    nodes_list = graph.add_nodes_bulk('' for _ in range(size)) # List with all nodes ids
+
+    # One triple per non null cell instead of one add_edge per parallel edge
+    graph.add_edges_bulk((nodes_list[i], nodes_list[j], edges) for i, j, edges in triples)
 
     return graph
 
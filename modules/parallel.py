@@ -0,0 +1,74 @@
+"""
+Runs analyses over many graphs, components or input batches in a process pool.
+
+Graphs cross process boundaries as compact_digraph arrays rather than pickled node
+objects, so they must have integer ids. The mapped functions must be picklable
+(defined at module level). Results always come back in the order of the inputs.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from modules.bool_circ import compiled_circuit
+from modules.compact_digraph import compact_digraph
+
+
+def _apply(fn, materialize, graph):
+    if materialize:
+        graph = graph.to_open_digraph()
+    return fn(graph)
+
+
+def _map(fn, items, workers, chunksize, executor, initializer=None, initargs=()):
+    if executor is not None:
+        return list(executor.map(fn, items, chunksize=chunksize))
+    with ProcessPoolExecutor(max_workers=workers, initializer=initializer,
+                             initargs=initargs) as pool:
+        return list(pool.map(fn, items, chunksize=chunksize))
+
+
+def map_graphs(fn, graphs, workers=None, chunksize=1, materialize=True, executor=None):
+    """
+    Returns [fn(g) for g in graphs], computed in a process pool.
+    workers: number of processes, os.cpu_count() by default
+    chunksize: number of graphs sent to a worker at once
+    materialize: give fn an open_digraph rebuilt in the worker; otherwise fn gets the
+                 compact_digraph, which is enough for its read API
+    executor: an existing pool to use instead of starting one (workers is then ignored)
+    """
+    compacts = [g if isinstance(g, compact_digraph) else compact_digraph.from_open_digraph(g)
+                for g in graphs]
+    return _map(partial(_apply, fn, materialize), compacts, workers, chunksize, executor)
+
+
+def map_components(fn, graph, workers=None, chunksize=1, materialize=True, executor=None):
+    """
+    Returns fn applied to each connected component of graph, in the order of
+    open_digraph.split_components
+    """
+    return map_graphs(fn, graph.split_components(), workers, chunksize, materialize, executor)
+
+
+_worker_circuit = None # circuit evaluated by map_batches, set once per worker
+
+
+def _set_circuit(circuit):
+    global _worker_circuit
+    _worker_circuit = circuit
+
+
+def _evaluate(batch):
+    words, width = batch
+    return _worker_circuit.evaluate_batch(words, width)
+
+
+def map_batches(circuit, batches, workers=None, chunksize=1):
+    """
+    Evaluates a boolean circuit on many batches of input vectors in a process pool.
+    circuit: compiled_circuit, or an open_digraph to compile
+    batches: (words, width) pairs, see compiled_circuit.evaluate_batch
+    The circuit is sent once to each worker. Returns the output words of each batch.
+    """
+    if not isinstance(circuit, compiled_circuit):
+        circuit = compiled_circuit.compile(circuit)
+    return _map(_evaluate, list(batches), workers, chunksize, None,
+                initializer=_set_circuit, initargs=(circuit,))
@@ -0,0 +1,161 @@
+class reachability_index: # answers "does u reach v" on an acyclic open_digraph
+
+    def __init__(self, graph, method="bitset"):
+        '''
+        graph: open_digraph; must be acyclic, raises a ValueError otherwise
+        method: "bitset" keeps the ancestors of each node as an int bitset (n*n bits,
+                O(1) queries), "interval" keeps two ints per node and only walks the
+                graph when the intervals can't tell
+        '''
+        if method not in ("bitset", "interval"):
+            raise ValueError(f"Unknown reachability method {method}")
+        self.graph = graph
+        self.method = method
+        order = [node_id for layer in graph.topological_sort() for node_id in layer]
+        self.index = {node_id: i for i, node_id in enumerate(order)} # id -> bit position
+        self.ids = order
+        if method == "bitset":
+            self.ancestors = [0] * len(order) # bit i of ancestors[j]: ids[i] reaches ids[j]
+            for i, node_id in enumerate(order):
+                mask = 1 << i
+                for parent_id in graph.nodes[node_id].parents:
+                    mask |= self.ancestors[self.index[parent_id]]
+                self.ancestors[i] = mask
+        else:
+            self._label_intervals()
+
+    def _label_intervals(self):
+        """
+        Numbers the nodes in postorder along depth first searches from the sources, and
+        gives each node the smallest number of its descendants: if u reaches v, then
+        [low[v], post[v]] is inside [low[u], post[u]]
+        """
+        nodes = self.graph.nodes
+        self.post = [0] * len(self.ids)
+        seen = bytearray(len(self.ids))
+        count = 0
+        for root in self.ids:
+            if nodes[root].parents or seen[self.index[root]]:
+                continue
+            seen[self.index[root]] = 1
+            stack = [(root, iter(nodes[root].children))]
+            while stack:
+                node_id, children = stack[-1]
+                for child_id in children:
+                    if not seen[self.index[child_id]]:
+                        seen[self.index[child_id]] = 1
+                        stack.append((child_id, iter(nodes[child_id].children)))
+                        break
+                else:
+                    stack.pop()
+                    self.post[self.index[node_id]] = count
+                    count += 1
+        # Children come after their parents in self.ids
+        self.low = self.post.copy()
+        for i in reversed(range(len(self.ids))):
+            for child_id in nodes[self.ids[i]].children:
+                self.low[i] = min(self.low[i], self.low[self.index[child_id]])
+
+    def _position(self, node_id):
+        try:
+            return self.index[node_id]
+        except KeyError:
+            raise ValueError(f"{node_id} not in the graph") from None
+
+    def _may_reach(self, i, j):
+        return self.low[i] <= self.low[j] and self.post[j] <= self.post[i]
+
+    def reachable(self, u, v):
+        """
+        True if there is a path from u to v (u reaches itself)
+        """
+        i = self._position(u)
+        j = self._position(v)
+        if self.method == "bitset":
+            return self.ancestors[j] >> i & 1 == 1
+        if i == j:
+            return True
+        if not self._may_reach(i, j):
+            return False
+        # Search from u, skipping the nodes whose interval can't hold v
+        nodes = self.graph.nodes
+        seen = {u}
+        stack = [u]
+        while stack:
+            for child_id in nodes[stack.pop()].children:
+                k = self.index[child_id]
+                if k == j:
+                    return True
+                if child_id not in seen and self._may_reach(k, j):
+                    seen.add(child_id)
+                    stack.append(child_id)
+        return False
+
+    def ancestors_of(self, v):
+        """
+        Set of the ids that reach v, v included
+        """
+        j = self._position(v)
+        if self.method == "bitset":
+            return self._ids_of(self.ancestors[j])
+        nodes = self.graph.nodes
+        found = {v}
+        stack = [v]
+        while stack:
+            for parent_id in nodes[stack.pop()].parents:
+                if parent_id not in found:
+                    found.add(parent_id)
+                    stack.append(parent_id)
+        return found
+
+    def common_ancestors(self, u, v):
+        """
+        Set of the ids that reach both u and v (u itself if it reaches v)
+        """
+        if self.method == "bitset":
+            return self._ids_of(self.ancestors[self._position(u)] & self.ancestors[self._position(v)])
+        return self.ancestors_of(u) & self.ancestors_of(v)
+
+    def _ids_of(self, mask):
+        ids = set()
+        while mask:
+            low_bit = mask & -mask
+            ids.add(self.ids[low_bit.bit_length() - 1])
+            mask ^= low_bit
+        return ids
+
+    def add_node(self, node_id, parents, children):
+        """
+        Patches the index after node_id was added with these edges.
+        Returns False if the index can't be patched and has to be rebuilt.
+        """
+        if self.method != "bitset":
+            return False
+        self.index[node_id] = len(self.ids)
+        self.ids.append(node_id)
+        mask = 1 << self.index[node_id]
+        for parent_id in parents:
+            if parent_id in self.index:
+                mask |= self.ancestors[self.index[parent_id]]
+        self.ancestors.append(mask)
+        return all(self.add_edge(node_id, child_id) for child_id in children if child_id in self.index)
+
+    def add_edge(self, src, tgt):
+        """
+        Patches the index after an edge src -> tgt was added: the ancestors of src
+        become ancestors of every node tgt reaches.
+        Returns False if the index can't be patched (the edge closes a cycle).
+        """
+        if self.method != "bitset" or self.reachable(tgt, src):
+            return False
+        added = self.ancestors[self.index[src]]
+        nodes = self.graph.nodes
+        stack = [tgt]
+        while stack:
+            node_id = stack.pop()
+            i = self.index[node_id]
+            if self.ancestors[i] | added == self.ancestors[i]:
+                continue # Its descendants already have them too
+            self.ancestors[i] |= added
+            stack.extend(nodes[node_id].children)
+        return True
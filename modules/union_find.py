@@ -0,0 +1,41 @@
+class union_find: # disjoint sets over hashable elements
+
+    def __init__(self, elements=()):
+        '''
+        elements: iter; elements that start in their own set
+        '''
+        self.parent = {e: e for e in elements}
+        self.rank = dict.fromkeys(self.parent, 0)
+
+    def add(self, e):
+        if e not in self.parent:
+            self.parent[e] = e
+            self.rank[e] = 0
+
+    def find(self, e):
+        """
+        Representative of the set of e, with path compression
+        """
+        root = e
+        while self.parent[root] != root:
+            root = self.parent[root]
+        # Every element on the way now points to the root
+        while self.parent[e] != root:
+            self.parent[e], e = root, self.parent[e]
+        return root
+
+    def union(self, a, b):
+        """
+        Merges the sets of a and b, the shallower tree goes under the deeper one.
+        Returns the new representative.
+        """
+        ra = self.find(a)
+        rb = self.find(b)
+        if ra == rb:
+            return ra
+        if self.rank[ra] < self.rank[rb]:
+            ra, rb = rb, ra
+        self.parent[rb] = ra
+        if self.rank[ra] == self.rank[rb]:
+            self.rank[ra] += 1
+        return ra
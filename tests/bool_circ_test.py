@@ -0,0 +1,185 @@
+import sys
+import os
+root = os.path.expanduser('~/L2/ProjetInfo/Project-LDD2-S4')
+sys.path.append(root) # allows us to fetch files from the project root
+import random
+import time
+import unittest
+from modules.open_digraph import *
+from modules.bool_circ import *
+
+
+def half_adder():
+    # inputs 0, 1 -> sum (4), carry (5)
+    return open_digraph(
+        inputs=[0, 1], outputs=[4, 5],
+        nodes=[
+            node(0, '', {}, {2: 1}),
+            node(1, '', {}, {3: 1}),
+            node(2, '', {0: 1}, {6: 1, 7: 1}),
+            node(3, '', {1: 1}, {6: 1, 7: 1}),
+            node(6, '^', {2: 1, 3: 1}, {4: 1}),
+            node(7, '&', {2: 1, 3: 1}, {5: 1}),
+            node(4, '', {6: 1}, {}),
+            node(5, '', {7: 1}, {})
+        ])
+
+
+def random_circuit(rng, n_inputs, n_gates, n_outputs):
+    graph = open_digraph([], [], [])
+    pool = []
+    for _ in range(n_inputs):
+        copy = graph.add_node('')
+        graph.add_input_node(copy)
+        pool.append(copy)
+    for _ in range(n_gates):
+        label = rng.choice(['&', '|', '^', '~', '', '0', '1'])
+        parents = {}
+        if not pool or label in ('0', '1'):
+            label = label if label in ('0', '1') else '1'
+        elif label in ('~', ''):
+            parents = {rng.choice(pool): 1}
+        else:
+            for _ in range(rng.randint(0, 3)):
+                parent = rng.choice(pool)
+                parents[parent] = parents.get(parent, 0) + 1
+        pool.append(graph.add_node(label, parents=parents))
+    for _ in range(n_outputs if pool else 0):
+        graph.add_output_node(rng.choice(pool))
+    return graph
+
+
+class EvaluationTest(unittest.TestCase):
+
+    def test_evaluate(self):
+        circuit = compiled_circuit.compile(half_adder())
+        for a in (0, 1):
+            for b in (0, 1):
+                self.assertEqual(circuit.evaluate([a, b]), [bool(a ^ b), bool(a & b)])
+
+    def test_truth_table(self):
+        circuit = compiled_circuit.compile(half_adder())
+        # Vectors k = 0..3, input i is bit i of k
+        self.assertEqual(circuit.truth_table(), [0b0110, 0b1000])
+
+    def test_gates(self):
+        graph = open_digraph([], [], [])
+        x = graph.add_node('1')
+        y = graph.add_node('0')
+        n = graph.add_node('~', parents={x: 1})
+        o = graph.add_node('|', parents={n: 1, y: 1})
+        z = graph.add_node('^', parents={x: 2})
+        a = graph.add_node('&')
+        for gate in (n, o, z, a):
+            graph.add_output_node(gate)
+        self.assertEqual(compiled_circuit.compile(graph).evaluate([]), [False, False, False, True])
+
+        graph.nodes[a].label = '?'
+        with self.assertRaises(ValueError):
+            compiled_circuit.compile(graph)
+
+    @unittest.skipIf(np is None, "numpy is not installed")
+    def test_numpy_words(self):
+        circuit = compiled_circuit.compile(half_adder())
+        a = np.array([0b1100, 2**64 - 1], dtype=np.uint64)
+        b = np.array([0b1010, 0], dtype=np.uint64)
+        s, c = circuit.evaluate_batch([a, b])
+        self.assertEqual(s.tolist(), [0b0110, 2**64 - 1])
+        self.assertEqual(c.tolist(), [0b1000, 0])
+
+    def test_exhaustive_parity(self):
+        # Parity of 20 inputs, checked on all the 2^20 vectors
+        n = 20
+        graph = open_digraph([], [], [])
+        gates = [graph.add_node('') for _ in range(n)]
+        for gate in gates:
+            graph.add_input_node(gate)
+        while len(gates) > 1:
+            gates = [graph.add_node('^', parents={gates[i]: 1, gates[i + 1]: 1})
+                     for i in range(0, len(gates) - 1, 2)] + gates[len(gates) - len(gates) % 2:]
+        graph.add_output_node(gates[0])
+
+        start = time.perf_counter()
+        [parity] = compiled_circuit.compile(graph).truth_table()
+        self.assertLess(time.perf_counter() - start, 1)
+        for k in (0, 1, 3, 12345, 2**20 - 1):
+            self.assertEqual((parity >> k) & 1, bin(k).count('1') % 2)
+
+
+
+class SimplificationTest(unittest.TestCase):
+
+    def test_simplify(self):
+        # out = ~~(x & x & 1) | 0
+        graph = open_digraph([], [], [])
+        x = graph.add_node('')
+        graph.add_input_node(x)
+        one = graph.add_node('1')
+        zero = graph.add_node('0')
+        a = graph.add_node('&', parents={x: 2, one: 1})
+        n1 = graph.add_node('~', parents={a: 1})
+        n2 = graph.add_node('~', parents={n1: 1})
+        o = graph.add_node('|', parents={n2: 1, zero: 1})
+        out = graph.add_output_node(o)
+
+        stats = simplify(graph)
+        graph.assert_is_well_formed()
+        # Only the input, its copy and the output are left
+        self.assertEqual(len(graph.nodes), 3)
+        self.assertEqual(graph.nodes[out].parents, {x: 1})
+        self.assertEqual([s['pass'] for s in stats],
+                         ['constant_propagation', 'double_negation', 'copy_fusion',
+                          'idempotent_gates', 'duplicate_gates', 'dead_gates'])
+        self.assertEqual(sum(s['nodes'] for s in stats), -6)
+        self.assertTrue(all(s['time'] >= 0 for s in stats))
+
+    def test_duplicate_gates(self):
+        graph = open_digraph([], [], [])
+        x, y = graph.add_node(''), graph.add_node('')
+        graph.add_input_node(x)
+        graph.add_input_node(y)
+        a1 = graph.add_node('&', parents={x: 1, y: 1})
+        a2 = graph.add_node('&', parents={x: 1, y: 1})
+        o = graph.add_node('^', parents={a1: 1, a2: 1})
+        graph.add_output_node(o)
+        simplify(graph)
+        # a1 ^ a1 = 0
+        self.assertEqual(compiled_circuit.compile(graph).truth_table(), [0])
+        self.assertEqual(sorted(n.label for n in graph.nodes.values()), ['', '', '', '', '', '0'])
+
+    def test_simplify_keeps_truth_tables(self):
+        rng = random.Random(0)
+        for _ in range(300):
+            graph = random_circuit(rng, rng.randint(0, 4), rng.randint(0, 15), rng.randint(1, 3))
+            before = compiled_circuit.compile(graph).truth_table()
+            simplify(graph)
+            graph.assert_is_well_formed()
+            self.assertEqual(compiled_circuit.compile(graph).truth_table(), before)
+            # Nothing is left to do
+            self.assertTrue(all(s['rewrites'] == 0 for s in simplify(graph)))
+
+    def test_simplify_snapshot(self):
+        # The rules must not keep a node across a change: a snapshot clones it
+        graph = open_digraph([], [], [])
+        one = graph.add_node('1')
+        a = graph.add_node('&', parents={one: 1})
+        graph.add_output_node(a)
+        snap = graph.snapshot()
+        self.assertTrue(constant_propagation(snap, a, set(snap.outputs)))
+        self.assertEqual((snap.nodes[a].label, snap.nodes[a].parents), ('1', {}))
+        self.assertEqual((graph.nodes[a].label, graph.nodes[a].parents), ('&', {one: 1}))
+
+        rng = random.Random(1)
+        for _ in range(100):
+            graph = random_circuit(rng, rng.randint(0, 4), rng.randint(0, 15), rng.randint(1, 3))
+            before = {node_id: n.copy() for node_id, n in graph.nodes.items()}
+            copied, snap = graph.copy(), graph.snapshot()
+            simplify(copied)
+            simplify(snap)
+            snap.assert_is_well_formed()
+            self.assertEqual((snap.inputs, snap.outputs, snap.nodes),
+                             (copied.inputs, copied.outputs, copied.nodes))
+            self.assertEqual(graph.nodes, before)
+
+if __name__ == '__main__': # the following code is called only when
+    unittest.main() # precisely this file is run
@@ -0,0 +1,99 @@
+import sys
+import os
+import struct
+import tempfile
+root = os.path.expanduser('~/L2/ProjetInfo/Project-LDD2-S4')
+sys.path.append(root) # allows us to fetch files from the project root
+import unittest
+from modules.open_digraph import *
+from modules.compact_digraph import *
+
+
+class CompactTest(unittest.TestCase):
+
+    def setUp(self):
+        self.graph = open_digraph(
+            inputs=[0], outputs=[3],
+            nodes=[
+                node(0, 'Input', {}, {1: 1}),
+                node(1, '&', {0: 1, 2: 2}, {2: 1, 3: 1}),
+                node(2, '|', {1: 1}, {1: 2}),
+                node(3, 'Output', {1: 1}, {})
+            ])
+
+    def test_round_trip(self):
+        c = compact_digraph.from_open_digraph(self.graph)
+        self.assertEqual(len(c), 4)
+        g = c.to_open_digraph()
+        self.assertEqual(g.nodes, self.graph.nodes)
+        self.assertEqual(g.inputs, [0])
+        self.assertEqual(g.outputs, [3])
+
+    def test_read_api(self):
+        c = compact_digraph.from_open_digraph(self.graph)
+        self.assertEqual(c.get_node_by_id(1), self.graph.nodes[1])
+        self.assertIsNone(c.get_node_by_id(42))
+        self.assertEqual(c.get_label(2), '|')
+        self.assertEqual(c.get_parents(1), {0: 1, 2: 2})
+        self.assertEqual(c.multiplicity(2, 1), 2)
+        self.assertEqual(c.multiplicity(0, 3), 0)
+        self.assertEqual(c.adjacency_matrix(), self.graph.adjacency_matrix())
+
+    def test_is_well_formed(self):
+        self.assertTrue(compact_digraph.from_open_digraph(self.graph).is_well_formed())
+        self.graph.nodes[2].parents[1] = 3 # Mismatched multiplicity
+        c = compact_digraph.from_open_digraph(self.graph)
+        self.assertFalse(c.is_well_formed())
+        with self.assertRaises(ValueError):
+            c.assert_is_well_formed()
+
+    def test_traversals(self):
+        c = compact_digraph.from_open_digraph(self.graph)
+        self.assertEqual(list(c.iter_bfs(0)), [0, 1, 2, 3])
+        self.assertEqual(list(c.iter_dfs(3, direction=-1)), [3, 1, 0, 2])
+        self.assertEqual(set(c.iter_bfs(3, direction=None)), {0, 1, 2, 3})
+
+
+    def test_binary_snapshot(self):
+        self.graph.nodes[1].label = 'é'
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'graph.odg')
+            self.graph.save_binary(path)
+
+            g = open_digraph.load_binary(path)
+            self.assertEqual(g.nodes, self.graph.nodes)
+            self.assertEqual((g.inputs, g.outputs), ([0], [3]))
+            self.assertEqual(g.new_id(), 4)
+
+            lazy = open_digraph.load_binary(path, lazy=True)
+            self.assertIsInstance(lazy, compact_digraph)
+            self.assertEqual(lazy.get_node_by_id(1), self.graph.nodes[1])
+            self.assertEqual(lazy.multiplicity(2, 1), 2)
+            self.assertTrue(lazy.is_well_formed())
+
+            copied = compact_digraph.load_binary(path, use_mmap=False)
+            self.assertEqual(copied.to_open_digraph().nodes, self.graph.nodes)
+
+            # Files written with the other byte order are swapped when loaded
+            other = 'big' if sys.byteorder == 'little' else 'little'
+            compact_digraph.from_open_digraph(self.graph).save_binary(path, byteorder=other)
+            for use_mmap in (True, False):
+                swapped = compact_digraph.load_binary(path, use_mmap=use_mmap)
+                self.assertEqual(swapped.to_open_digraph().nodes, self.graph.nodes)
+                self.assertEqual((list(swapped.inputs), list(swapped.outputs)), ([0], [3]))
+            # The flag alone decides: flipped on a native file, the ids come out swapped
+            self.graph.save_binary(path)
+            with open(path, 'r+b') as f:
+                f.seek(6)
+                f.write(struct.pack('<H', sys.byteorder == 'little'))
+            flipped = compact_digraph.load_binary(path)
+            self.assertEqual(list(flipped.ids),
+                             [int.from_bytes(i.to_bytes(8, sys.byteorder), other) for i in range(4)])
+
+            with open(path, 'wb') as f:
+                f.write(b'digraph G {}')
+            with self.assertRaises(ValueError):
+                open_digraph.load_binary(path)
+
+if __name__ == '__main__': # the following code is called only when
+    unittest.main() # precisely this file is run
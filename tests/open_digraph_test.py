@@ -1,9 +1,12 @@
+import io
 import sys
 import os
 root = os.path.expanduser('~/L2/ProjetInfo/Project-LDD2-S4')
 sys.path.append(root) # allows us to fetch files from the project root
+import random
 import unittest
 from modules.open_digraph import * 
+from modules.compact_digraph import compact_digraph
 
 
 class InitTest(unittest.TestCase):
@@ -18,6 +21,16 @@ class InitTest(unittest.TestCase):
         self.assertIsNot(n0.copy(),n0)
 
 
+    def test_slots(self):
+        n0 = node(0, 'i', {}, {})
+        G = open_digraph([], [], [n0])
+        self.assertFalse(hasattr(n0, '__dict__'))
+        self.assertFalse(hasattr(G, '__dict__'))
+        with self.assertRaises(AttributeError):
+            n0.colour = 'red'
+        self.assertEqual(n0.copy(), n0)
+        self.assertEqual(G.copy().nodes, G.nodes)
+
     def test_open_digraph(self):
         n0 = node(0, 'i1', {}, {1:1})
         n1 = node(1, 'i2', {0:1}, {})
@@ -200,6 +213,56 @@ class InitTest(unittest.TestCase):
         self.assertFalse(malformed_graph_2.is_well_formed())
         self.assertFalse(malformed_graph_3.is_well_formed())
 
+    def test_well_formedness_errors(self):
+        graph = open_digraph(
+            inputs=[0], outputs=[2],
+            nodes=[
+                node(0, 'Input', {}, {1: 1}),
+                node(1, 'Middle', {0: 2}, {2: 1}),
+                node(2, 'Output', {1: 1}, {})
+            ])
+        self.assertEqual(graph.well_formedness_errors(),
+                         ["edge 0 -> 1 has multiplicity 1 in the children of 0 but 2 in the parents of 1",
+                          "edge 0 -> 1 has multiplicity 2 in the parents of 1 but 1 in the children of 0"])
+        with self.assertRaisesRegex(ValueError, "edge 0 -> 1"):
+            graph.assert_is_well_formed()
+
+        graph.nodes[1].parents[0] = 1
+        graph.set_outputs([2, 3])
+        self.assertEqual(graph.well_formedness_errors(), ["output 3 is not in the graph"])
+
+    def test_incremental_check(self):
+        graph = open_digraph(
+            inputs=[0], outputs=[2],
+            nodes=[
+                node(0, 'Input', {}, {1: 1}),
+                node(1, 'Middle', {0: 1}, {2: 1}),
+                node(2, 'Output', {1: 1}, {})
+            ])
+        graph.enable_incremental_check()
+        self.assertTrue(graph.is_well_formed())
+
+        # A change that is not made through the graph methods goes unnoticed...
+        graph.nodes[1].label = 'Changed'
+        graph.nodes[1].parents[0] = 2
+        self.assertTrue(graph.is_well_formed())
+        # ...until the node is touched
+        graph.add_edge(1, 1)
+        self.assertFalse(graph.is_well_formed())
+        self.assertFalse(graph.is_well_formed())
+        graph.nodes[1].parents[0] = 1
+        self.assertTrue(graph.is_well_formed())
+
+        graph.add_edge(1, 2)
+        self.assertEqual(graph.well_formedness_errors(), ["output 2 has an edge of multiplicity 2"])
+        graph.remove_edge(1, 2)
+        self.assertTrue(graph.is_well_formed())
+
+        graph.add_output_node(0)
+        self.assertEqual(graph.well_formedness_errors(), ["input 0 has 2 children instead of 1"])
+        graph.disable_incremental_check()
+        self.assertFalse(graph.is_well_formed())
+
     def test_add_input_node(self):
         graph = open_digraph([], [], [node(0, 'Existing', {}, {})])
         graph.add_input_node(0)
@@ -229,10 +292,522 @@ class InitTest(unittest.TestCase):
         self.assertEqual(graph.nodes[0].children[output_node_id], 1)
         graph.assert_is_well_formed()
 
+    def test_new_id(self):
+        # Gaps left by direct construction are filled first
+        graph = open_digraph([], [], [node(0, '', {}, {}), node(2, '', {}, {})])
+        self.assertEqual(graph.new_id(), 1)
+        self.assertEqual(graph.new_id(), 1) # Only a query: nothing is used up
+        self.assertEqual(graph.add_node(), 1)
+        self.assertEqual(graph.new_id(), 3)
+
+        # Ids of removed nodes are reused, smallest first
+        graph = open_digraph([], [], [])
+        ids = [graph.add_node() for _ in range(5)]
+        self.assertEqual(ids, [0, 1, 2, 3, 4])
+        graph.remove_nodes_by_id(3, 1)
+        self.assertEqual(graph.add_node(), 1)
+        self.assertEqual(graph.add_node(), 3)
+        self.assertEqual(graph.add_node(), 5)
+
+        # The copy keeps the allocator state but not the same free list
+        graph.remove_node_by_id(0)
+        graph2 = graph.copy()
+        self.assertEqual(graph2.add_node(), 0)
+        self.assertEqual(graph.add_node(), 0)
+
+        # Nodes put in by hand are skipped
+        graph.nodes[6] = node(6, '', {}, {})
+        self.assertEqual(graph.add_node(), 7)
+
+        # A large id only leaves one range of free ids below it
+        big = 10 ** 12
+        graph = open_digraph([], [], [node(big, '', {}, {}), node(3, '', {}, {})])
+        self.assertEqual(graph._free_ids, [(0, 3), (4, big)])
+        self.assertEqual([graph.add_node() for _ in range(5)], [0, 1, 2, 4, 5])
+        graph.nodes[6] = node(6, '', {}, {})
+        self.assertEqual(graph.add_node(), 7)
+        graph.remove_node_by_id(1)
+        self.assertEqual(graph.add_node(), 1)
+        graph = open_digraph.from_edge_list([(3 * big, 0)])
+        self.assertEqual(graph.add_node(), 1)
+        graph.shift_indices(big)
+        self.assertEqual(graph.new_id(), 0)
+
+    def test_bulk_construction(self):
+        graph = open_digraph.from_edge_list([(0, 1, 2), (0, 1), (1, 2, 1), (2, 3, 0)],
+                                            labels={0: 'a', 4: 'e'}, outputs=[2])
+        self.assertEqual(graph.nodes[0], node(0, 'a', {}, {1: 3}))
+        self.assertEqual(graph.nodes[1], node(1, '', {0: 3}, {2: 1}))
+        self.assertEqual(graph.nodes[4], node(4, 'e', {}, {}))
+        self.assertNotIn(3, graph.nodes)
+        self.assertEqual(graph.outputs, [2])
+        graph.assert_is_well_formed()
+
+        ids = graph.add_nodes_bulk(['x', 'y'])
+        self.assertEqual(ids, [3, 5])
+        graph.add_edges_bulk({(3, 5): 2, (0, 3): 1})
+        self.assertEqual(graph.nodes[3].children, {5: 2})
+        self.assertEqual(graph.nodes[0].children, {1: 3, 3: 1})
+        graph.assert_is_well_formed()
+
+        # Nothing is added if an endpoint is missing
+        with self.assertRaises(ValueError):
+            graph.add_edges_bulk([(0, 1), (0, 42)])
+        self.assertEqual(graph.nodes[0].children, {1: 3, 3: 1})
+
+        m = [[0, 2, 0], [0, 0, 1], [3, 0, 0]]
+        self.assertEqual(graph_from_adjacency_matrix(m).adjacency_matrix(), m)
+
     def test_create_graph(self): 
-        # Faire ces tests
         free_graph = open_digraph.random(n=4, bound=3, form="free")
-        ...
+        self.assertEqual(len(free_graph.nodes), 4)
+
+        # Same seed, same graph
+        m = open_digraph.random(n=10, bound=3, form="free", seed=7).adjacency_matrix()
+        self.assertEqual(open_digraph.random(n=10, bound=3, form="free", seed=7).adjacency_matrix(), m)
+
+        for density in (None, 0.2, 0.9):
+            dag = open_digraph.random(n=20, bound=3, form="DAG", density=density, seed=1).adjacency_matrix()
+            self.assertTrue(all(dag[i][j] == 0 for i in range(20) for j in range(i + 1)))
+            oriented = open_digraph.random(n=20, bound=3, form="oriented", density=density, seed=1).adjacency_matrix()
+            self.assertTrue(all(oriented[i][j] == 0 or oriented[j][i] == 0 for i in range(20) for j in range(20)))
+            loop_free = open_digraph.random(n=20, bound=3, form="loop-free", density=density, seed=1).adjacency_matrix()
+            self.assertTrue(all(loop_free[i][i] == 0 for i in range(20)))
+            undirected = open_digraph.random(n=20, bound=3, form="undirected", density=density, seed=1).adjacency_matrix()
+            self.assertTrue(all(undirected[i][j] == undirected[j][i] for i in range(20) for j in range(20)))
+
+        # Every allowed cell at density 1
+        full = open_digraph.random(n=30, bound=1, form="DAG", density=1, seed=1)
+        self.assertEqual(full.num_edges(), 30 * 29 // 2)
+        full = open_digraph.random(n=30, bound=1, form="free", density=1, seed=1)
+        self.assertEqual(full.num_edges(), 30 * 30)
+
+        graph = open_digraph.random(n=10, bound=1, inputs=2, outputs=3, form="DAG", seed=3)
+        self.assertEqual((len(graph.inputs), len(graph.outputs), len(graph.nodes)), (2, 3, 15))
+        graph.assert_is_well_formed()
+        with self.assertRaises(ValueError):
+            open_digraph.random(n=4, bound=3, form="tree")
+
+    def test_topological_sort(self):
+        graph = open_digraph.from_edge_list([(0, 2), (1, 2), (2, 3), (0, 3, 2), (3, 4)], labels={5: ''})
+        self.assertEqual(graph.topological_sort(), [[5, 0, 1], [2], [3], [4]])
+        self.assertEqual(graph.node_depth(3), 2)
+        self.assertEqual(graph.graph_depth(), 4)
+        self.assertIsNone(graph.is_cyclic())
+
+        # The cache follows the mutations
+        graph.add_edge(4, 5)
+        self.assertEqual(graph.node_depth(5), 4)
+        graph.add_edge(4, 2)
+        cycle = graph.is_cyclic()
+        self.assertEqual(sorted(cycle), [2, 3, 4])
+        for i, node_id in enumerate(cycle):
+            self.assertIn(cycle[(i + 1) % len(cycle)], graph.nodes[node_id].children)
+        with self.assertRaises(ValueError):
+            graph.topological_sort()
+
+        graph.remove_edge(4, 2)
+        graph.add_edge(1, 1)
+        self.assertEqual(graph.is_cyclic(), [1])
+
+        # Deep graphs don't hit the recursion limit
+        chain = open_digraph.from_edge_list((i, i + 1) for i in range(20000))
+        self.assertEqual(chain.graph_depth(), 20001)
+
+    def test_hash_consing(self):
+        graph = open_digraph([], [], [])
+        x, y = graph.add_node(''), graph.add_node('')
+        a = graph.add_node('&', parents={x: 1, y: 1})
+        graph.enable_hash_consing()
+
+        # Same label and parents: the node already in the graph is returned
+        self.assertEqual(graph.add_node('&', parents={y: 1, x: 1}), a)
+        self.assertEqual(graph.structural_hash(a), hash(structural_key('&', {x: 1, y: 1})))
+        self.assertNotEqual(graph.add_node('&', parents={x: 2, y: 1}), a)
+        o = graph.add_node('|', parents={x: 1, y: 1})
+        self.assertNotEqual(o, a)
+        # Nodes without parents, or created with children, are never shared
+        self.assertNotEqual(graph.add_node(''), graph.add_node(''))
+        self.assertNotEqual(graph.add_node('&', parents={x: 1, y: 1}, children={o: 1}), a)
+
+        # The table follows the mutations
+        graph.add_edge(o, a)
+        self.assertNotEqual(graph.add_node('&', parents={x: 1, y: 1}), a)
+        self.assertEqual(graph.add_node('&', parents={x: 1, y: 1, o: 1}), a)
+        graph.set_node_label(a, '^')
+        self.assertEqual(graph.add_node('^', parents={x: 1, y: 1, o: 1}), a)
+        graph.remove_node_by_id(a)
+        n = len(graph.nodes)
+        graph.add_node('^', parents={x: 1, y: 1, o: 1})
+        self.assertEqual(len(graph.nodes), n + 1)
+        graph.assert_is_well_formed()
+
+        graph.disable_hash_consing()
+        n = len(graph.nodes)
+        graph.add_node('|', parents={x: 1, y: 1})
+        self.assertEqual(len(graph.nodes), n + 1)
+
+        # An output is never an existing copy of its parent
+        graph = open_digraph([], [], [])
+        a = graph.add_node('&')
+        c = graph.add_node('', parents={a: 1})
+        graph.add_node('~', parents={c: 1})
+        graph.enable_hash_consing()
+        out = graph.add_output_node(a)
+        self.assertNotEqual(out, c)
+        self.assertEqual(graph.well_formedness_errors(), [])
+        self.assertEqual(graph.add_node('', parents={a: 1}), c)
+
+    def test_parallel(self):
+        f = open_digraph([0], [2], [node(0, 'i', {}, {1: 1}), node(1, '~', {0: 1}, {2: 1}), node(2, 'o', {1: 1}, {})])
+        g = open_digraph([5], [6], [node(5, 'i', {}, {6: 1}), node(6, 'o', {5: 1}, {})])
+        h = f.parallel(g)
+        self.assertEqual(h.inputs, [0, 3])
+        self.assertEqual(h.outputs, [2, 4])
+        self.assertEqual(h.nodes[3], node(3, 'i', {}, {4: 1}))
+        h.assert_is_well_formed()
+        # f and g are left as they were
+        self.assertEqual((f.inputs, len(f.nodes), g.inputs), ([0], 3, [5]))
+
+        # Ids put in by hand are avoided
+        f.nodes[3] = node(3, 'x', {}, {})
+        self.assertEqual(f.iparallel(g), -1)
+        self.assertEqual(f.inputs, [0, 4])
+        self.assertEqual(f.add_node(), 6)
+
+        # With itself, in place
+        f = open_digraph([0], [2], [node(0, 'i', {}, {1: 1}), node(1, '~', {0: 1}, {2: 1}), node(2, 'o', {1: 1}, {})])
+        self.assertEqual(f.iparallel(f), 3)
+        self.assertEqual((f.inputs, f.outputs, len(f.nodes)), ([0, 3], [2, 5], 6))
+        f.assert_is_well_formed()
+
+        k = open_digraph([], [], [node(0, '', {}, {})])
+        k.shift_indices(10)
+        self.assertEqual(list(k.nodes), [10])
+
+    def test_compose(self):
+        f = open_digraph([0], [2], [node(0, 'i', {}, {1: 1}), node(1, '~', {0: 1}, {2: 1}), node(2, 'o', {1: 1}, {})])
+        g = open_digraph([0, 1], [3], [node(0, 'i', {}, {2: 1}), node(1, 'i', {}, {2: 1}),
+                                       node(2, '&', {0: 1, 1: 1}, {3: 1}), node(3, 'o', {2: 1}, {})])
+        with self.assertRaises(ValueError):
+            g.compose(f)
+
+        # f after g: the output of g goes into the input of f
+        h = f.compose(g)
+        self.assertEqual(h.inputs, [3, 4])
+        self.assertEqual(h.outputs, [2])
+        self.assertEqual(h.nodes[6].children, {0: 1})
+        self.assertEqual(h.nodes[0].parents, {6: 1})
+        h.assert_is_well_formed()
+        self.assertEqual(f.inputs, [0])
+
+        # With itself, in place: two negations in a row
+        self.assertEqual(f.icompose(f), 3)
+        self.assertEqual((f.inputs, f.outputs), ([3], [2]))
+        self.assertEqual(f.nodes[5].children, {0: 1})
+        f.assert_is_well_formed()
+
+    def test_connected_components(self):
+        f = open_digraph([0], [2], [node(0, 'i', {}, {1: 1}), node(1, '~', {0: 1}, {2: 1}), node(2, 'o', {1: 1}, {})])
+        g = f.parallel(f)
+        g.add_node('alone')
+        self.assertEqual(g.connected_components(), {0: 0, 1: 0, 2: 0, 3: 1, 4: 1, 5: 1, 6: 2})
+
+        parts = list(g.split_components())
+        self.assertEqual(len(parts), 3)
+        self.assertEqual((parts[1].inputs, parts[1].outputs), ([3], [5]))
+        self.assertEqual(parts[1].nodes, {i: g.nodes[i] for i in (3, 4, 5)})
+        self.assertEqual(list(parts[2].nodes), [6])
+        for part in parts:
+            part.assert_is_well_formed()
+        # The parts don't share nodes with the graph
+        parts[0].remove_edge(0, 1)
+        self.assertEqual(g.nodes[0].children, {1: 1})
+
+    def test_copy(self):
+        g = open_digraph([0], [2], [node(0, 'i', {}, {1: 1}), node(1, '~', {0: 1}, {2: 1}), node(2, 'o', {1: 1}, {})])
+        c = g.copy()
+        c.add_input_node(1)
+        c.add_output_id(1)
+        self.assertEqual((g.inputs, g.outputs), ([0], [2]))
+        self.assertIsNot(c.nodes[1], g.nodes[1])
+        self.assertEqual(open_digraph().inputs, [])
+
+    def test_snapshot(self):
+        g = open_digraph.random(30, 2, inputs=3, outputs=3, form="DAG", seed=4)
+        reference = g.copy()
+        nodes = g.nodes
+        s = g.snapshot()
+        self.assertIs(s.nodes.base, nodes)
+
+        rng = random.Random(4)
+        for _ in range(40):
+            ids = list(s.nodes)
+            u, v = rng.choice(ids), rng.choice(ids)
+            choice = rng.randrange(4)
+            if choice == 0:
+                s.add_edge(u, v)
+            elif choice == 1 and s.nodes[u].children:
+                s.remove_edge(u, next(iter(s.nodes[u].children)))
+            elif choice == 2:
+                s.add_node('x', parents={u: 1})
+            elif u not in s.inputs and u not in s.outputs:
+                s.remove_node_by_id(u)
+        s.set_node_label(ids[0], 'changed')
+        s.add_input_node(ids[1])
+
+        # The original did not move, and only the changed nodes were cloned
+        self.assertEqual(g.nodes, reference.nodes)
+        self.assertEqual((g.inputs, g.outputs), (reference.inputs, reference.outputs))
+        self.assertTrue(all(s.nodes[i] is g.nodes[i] for i in s.nodes if i not in s._owned and i in g.nodes))
+
+        # Only the changes are stored: neither graph copied the dict of the original
+        self.assertIs(g.nodes, nodes)
+        big = open_digraph.random(2000, 1, form="DAG", density=0.002, seed=4)
+        big_snapshot = big.snapshot()
+        big_snapshot.add_edge(0, 1)
+        big_snapshot.add_node('x')
+        self.assertEqual(len(big_snapshot.nodes.local) + len(big_snapshot.nodes.tail), 3)
+
+        # The original clones too when it changes first, and keeps the old node for s2
+        s2 = g.snapshot()
+        g.add_edge(0, 1)
+        g.remove_node_by_id(ids[2])
+        g.add_node('new')
+        self.assertIs(g.nodes, nodes)
+        self.assertEqual(s2.nodes, reference.nodes)
+        self.assertEqual(g.nodes[0].children.get(1, 0), reference.nodes[0].children.get(1, 0) + 1)
+
+        # Snapshots of snapshots share the same base
+        s3 = s2.snapshot()
+        self.assertIs(s3.nodes.base, nodes)
+        s3.add_edge(0, 1)
+        self.assertEqual(s2.nodes, reference.nodes)
+
+        # Once the snapshots are gone, the original stops cloning its nodes
+        del s, s2, s3, big_snapshot
+        g.add_node('other')
+        self.assertIsNone(g._owned)
+
+    def test_journal(self):
+        for seed in range(30):
+            rng = random.Random(seed)
+            g = open_digraph.random(12, 2, inputs=2, outputs=2, form="loop-free", seed=seed)
+            original = g.copy()
+            g.enable_journal()
+            for _ in range(25):
+                ids = list(g.nodes)
+                u, v = rng.sample(ids, 2)
+                choice = rng.randrange(8)
+                if choice == 0:
+                    g.add_edge(u, v)
+                elif choice == 1 and g.nodes[u].children:
+                    g.remove_parallel_edges(u, next(iter(g.nodes[u].children)))
+                elif choice == 2:
+                    g.add_node('x', parents={u: 2}, children={v: 1})
+                elif choice == 3 and u not in g.inputs:
+                    g.remove_node_by_id(u)
+                elif choice == 4:
+                    g.add_edges_bulk([(u, v, 3), (v, u)])
+                elif choice == 5:
+                    g.set_node_label(u, 'label')
+                elif choice == 6:
+                    g.add_input_node(u)
+                else:
+                    g.iparallel(open_digraph.random(3, 1, inputs=1, seed=seed))
+            final = g.copy()
+            while g.undo():
+                pass
+            self.assertEqual((g.nodes, g.inputs, g.outputs), (original.nodes, original.inputs, original.outputs))
+            while g.redo():
+                pass
+            self.assertEqual((g.nodes, g.inputs, g.outputs), (final.nodes, final.inputs, final.outputs))
+        self.assertFalse(open_digraph().undo())
+
+    def test_transaction(self):
+        g = open_digraph([0], [2], [node(0, 'i', {}, {1: 1}), node(1, '~', {0: 1}, {2: 1}), node(2, 'o', {1: 1}, {})])
+        reference = g.copy()
+        with self.assertRaises(ValueError):
+            with g.transaction():
+                g.add_node('&', parents={1: 1})
+                g.remove_edges((0, 1), (1, 0)) # The second edge doesn't exist
+        self.assertEqual((g.nodes, g.inputs), (reference.nodes, reference.inputs))
+        self.assertIsNone(g._journal)
+
+        # A whole transaction is one step, an inner one only takes back its own changes
+        g.enable_journal()
+        with g.transaction():
+            x = g.add_node('x', parents={1: 1})
+            try:
+                with g.transaction():
+                    g.remove_node_by_id(x)
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+            g.set_node_label(x, 'y')
+        self.assertEqual(g.nodes[x].label, 'y')
+        g.undo()
+        self.assertEqual(g.nodes, reference.nodes)
+        g.redo()
+        self.assertEqual(g.nodes[x].children, {})
+
+    def test_node_index(self):
+        def scan(g, key):
+            return {node_id for node_id, n in g.nodes.items() if key(n)}
+
+        rng = random.Random(5)
+        g = open_digraph.random(20, 2, inputs=2, outputs=2, form="DAG", seed=5)
+        g.enable_node_index()
+        for step in range(60):
+            ids = list(g.nodes)
+            u, v = rng.sample(ids, 2)
+            choice = rng.randrange(5)
+            if choice == 0:
+                g.add_edge(u, v)
+            elif choice == 1 and g.nodes[u].children:
+                g.remove_edge(u, next(iter(g.nodes[u].children)))
+            elif choice == 2:
+                g.add_node(rng.choice('&|^'), parents={u: 1})
+            elif choice == 3 and u not in g.inputs and u not in g.outputs:
+                g.remove_node_by_id(u)
+            else:
+                g.set_node_label(u, rng.choice('&|^'))
+            if step % 10 == 0:
+                g.shift_indices(1)
+            for label in '&|^':
+                self.assertEqual(set(g.nodes_with_label(label)), scan(g, lambda n: n.label == label))
+            self.assertEqual(set(g.sources()), scan(g, lambda n: not n.parents))
+            self.assertEqual(set(g.sinks()), scan(g, lambda n: not n.children))
+            for d in range(4):
+                self.assertEqual(set(g.nodes_with_indegree(d)), scan(g, lambda n: sum(n.parents.values()) == d))
+                self.assertEqual(set(g.nodes_with_outdegree(d)), scan(g, lambda n: sum(n.children.values()) == d))
+
+        # Same answers without the index, and the copies have their own one
+        c = g.copy()
+        g.disable_node_index()
+        self.assertCountEqual(c.sources(), g.sources())
+        new = c.add_node('new')
+        self.assertEqual(c.nodes_with_label('new'), [new])
+        self.assertEqual(g.nodes_with_label('new'), [])
+
+    def test_degree_counters(self):
+        def check(g):
+            self.assertEqual(g.num_edges(), sum(sum(n.children.values()) for n in g.nodes.values()))
+            for node_id, n in g.nodes.items():
+                self.assertEqual(g.indegree(node_id), sum(n.parents.values()))
+                self.assertEqual(g.outdegree(node_id), sum(n.children.values()))
+            self.assertEqual(g.max_degree(), max((g.degree(i) for i in g.nodes), default=0))
+
+        for seed in range(20):
+            rng = random.Random(seed)
+            g = open_digraph.random(12, 3, inputs=2, outputs=2, form="free", seed=seed)
+            check(g)
+            g.enable_journal()
+            graphs = [g]
+            for _ in range(30):
+                ids = list(g.nodes)
+                u, v = rng.choice(ids), rng.choice(ids)
+                choice = rng.randrange(8)
+                if choice == 0:
+                    g.add_edge(u, v)
+                elif choice == 1 and g.nodes[u].children:
+                    g.remove_parallel_edges(u, next(iter(g.nodes[u].children)))
+                elif choice == 2:
+                    g.add_node('x', parents={u: 2}, children={v: 1})
+                elif choice == 3 and u not in g.inputs:
+                    g.remove_node_by_id(u)
+                elif choice == 4:
+                    g.add_edges_bulk([(u, v, 3), (v, u)])
+                elif choice == 5:
+                    g = g.snapshot()
+                    g.enable_journal()
+                    graphs.append(g)
+                elif choice == 6:
+                    g.iparallel(open_digraph.random(3, 2, inputs=1, seed=seed))
+                else:
+                    g.undo()
+                # The degree counts are brought up to date by max_degree: let changes pile up
+                if rng.random() < 0.5:
+                    check(g)
+            for h in graphs:
+                check(h)
+            check(open_digraph.from_dot_file(io.StringIO(g.to_dot_string())))
+        self.assertEqual(open_digraph().max_degree(), 0)
+
+        # Many parallel edges added and taken away between two queries
+        g = open_digraph.from_edge_list([(0, 2), (1, 2)])
+        for _ in range(3):
+            g.add_edges_bulk([(0, 1, 100000)])
+            self.assertEqual(g.max_degree(), 100001)
+            g.remove_parallel_edges(0, 1)
+            self.assertEqual(g.max_degree(), 2)
+        self.assertLess(len(g._degree_heap), 10)
+
+        # The counts only exist once max_degree was called; new nodes and bulk edges
+        # are then counted right away, only the ends of single edges wait for max_degree
+        g = open_digraph.from_edge_list([(0, 1), (1, 2)])
+        self.assertIsNone(g._degree_stale)
+        self.assertIsNone(g.snapshot()._degree_stale)
+        self.assertEqual(g.max_degree(), 2)
+        g.add_node('x', parents={0: 1})
+        g.add_edges_bulk([(2, 1, 2)])
+        self.assertEqual(list(g._degree_stale), [0])
+        self.assertEqual(g.max_degree(), 4)
+
+    def test_traversal(self):
+        # 0 -> 1 -> 3, 0 -> 2 -> 3 -> 4 (twice)
+        g = open_digraph.from_edge_list([(0, 1), (0, 2), (1, 3), (2, 3), (3, 4, 2)])
+        self.assertEqual(list(g.iter_bfs(0)), [0, 1, 2, 3, 4])
+        self.assertEqual(list(g.iter_dfs(0)), [0, 1, 3, 4, 2])
+        self.assertEqual(list(g.iter_bfs(3, direction=-1)), [3, 1, 2, 0])
+        self.assertEqual(list(g.iter_dfs(2, direction=None)), [2, 3, 4, 1, 0])
+        self.assertEqual(sorted(g.iter_edges()), [(0, 1, 1), (0, 2, 1), (1, 3, 1), (2, 3, 1), (3, 4, 2)])
+        self.assertRaises(ValueError, next, g.iter_bfs(9))
+
+        # Early exit: the search stops with the loop
+        visited = []
+        for node_id in g.iter_bfs(0):
+            visited.append(node_id)
+            if node_id == 1:
+                break
+        self.assertEqual(visited, [0, 1])
+
+        # Same orders as the compact form
+        c = compact_digraph.from_open_digraph(g)
+        self.assertEqual(list(g.iter_bfs(0)), list(c.iter_bfs(0)))
+        self.assertEqual(list(g.iter_dfs(4, -1)), list(c.iter_dfs(4, -1)))
+
+        # Views follow the node without copying and can't be written to
+        n = g.get_node_by_id(3)
+        view = n.children_view()
+        g.add_edge(3, 0)
+        self.assertEqual(dict(view), {4: 2, 0: 1})
+        self.assertEqual(dict(n.parents_view()), {1: 1, 2: 1})
+        with self.assertRaises(TypeError):
+            view[4] = 1
+        self.assertEqual(list(n.neighbours()), [4, 0, 1, 2])
+        self.assertIs(next(g.iter_nodes()), g.nodes[0])
+
+    def test_dijkstra(self):
+        # 0 -> 1 -> 2 -> 3 and a shortcut 0 -> 3, 4 -> 2
+        g = open_digraph.from_edge_list([(0, 1), (1, 2), (2, 3), (0, 3), (4, 2)])
+        dist, prev = g.dijkstra(0, direction=1)
+        self.assertEqual(dist, {0: 0, 1: 1, 2: 2, 3: 1})
+        self.assertEqual(prev, {1: 0, 2: 1, 3: 0})
+        self.assertEqual(g.dijkstra(2, direction=-1)[0], {2: 0, 1: 1, 4: 1, 0: 2})
+        self.assertEqual(g.dijkstra(4)[0], {4: 0, 2: 1, 1: 2, 3: 2, 0: 3})
+        self.assertEqual(g.dijkstra(0, weight=lambda a, b: 5 if (a, b) == (0, 3) else 1)[0][3], 3)
+
+        self.assertEqual(g.shortest_path(0, 2), [0, 1, 2])
+        self.assertEqual(g.shortest_path(0, 0), [0])
+        self.assertIsNone(g.shortest_path(3, 0))
+        self.assertEqual(g.shortest_path(3, 4, direction=None), [3, 2, 4])
+        self.assertEqual(g.distances_from([0, 4])[4], {4: 0, 2: 1, 3: 2})
+        self.assertRaises(ValueError, g.dijkstra, 9)
+
+        # The buffers are rebuilt after a mutation
+        g.add_edge(4, 3)
+        self.assertEqual(g.dijkstra(4, direction=1)[0], {4: 0, 2: 1, 3: 1})
 
     def test_adjacency_matrix(self):
         # Faire ces tests
@@ -240,6 +815,30 @@ class InitTest(unittest.TestCase):
         m = graph1.adjacency_matrix()
         ...
 
+    def test_sparse_adjacency_matrix(self):
+        graph = open_digraph([], [], [node(0, '', {1:3, 2:2}, {}), node(1, '', {}, {0:3, 2:4}), node(2, '', {1:4}, {0:2}), node(3, '', {}, {})])
+        dense = graph.adjacency_matrix()
+        self.assertEqual(dense, [[0, 0, 0, 0], [3, 0, 4, 0], [2, 0, 0, 0], [0, 0, 0, 0]])
+
+        coo = graph.adjacency_matrix(format="coo")
+        self.assertEqual(sorted(zip(*coo)), [(1, 0, 3), (1, 2, 4), (2, 0, 2)])
+        csr = graph.adjacency_matrix(format="csr")
+        self.assertEqual(csr, ([0, 0, 2, 3, 3], [0, 2, 0], [3, 4, 2]))
+
+        self.assertEqual(graph_from_adjacency_matrix(coo, format="coo", size=4).adjacency_matrix(), dense)
+        self.assertEqual(graph_from_adjacency_matrix(csr, format="csr").adjacency_matrix(), dense)
+        # Without size, the trailing isolated node is lost
+        self.assertEqual(len(graph_from_adjacency_matrix(coo, format="coo").nodes), 3)
+        with self.assertRaises(ValueError):
+            graph.adjacency_matrix(format="bsr")
+
+    @unittest.skipIf(np is None, "numpy is not installed")
+    def test_numpy_adjacency_matrix(self):
+        graph = open_digraph([], [], [node(0, '', {1:3, 2:2}, {}), node(1, '', {}, {0:3, 2:4}), node(2, '', {1:4}, {0:2})])
+        m = graph.adjacency_matrix(format="numpy")
+        self.assertEqual(m.tolist(), graph.adjacency_matrix())
+        self.assertEqual(graph_from_adjacency_matrix(m, format="numpy").adjacency_matrix(), m.tolist())
+
     def test_to_dot_file(self):
         # Create an instance of the open_digraph class
         graph = open_digraph.random(n=5, bound=3, form="DAG")
@@ -274,6 +873,68 @@ class InitTest(unittest.TestCase):
         print("\n\n")
         print(graph2)
         
+    def test_from_dot_stream(self):
+        source = io.StringIO(
+            '/* a comment */ digraph G {\n'
+            '    rankdir = LR; node [shape=box]\n'
+            '    5 -> 7 -> 9; 7 -> 9 // edges before their nodes\n'
+            '    9 [label="Out"]; 5 [label="In"] 7 [label="&"]\n'
+            '}\n')
+        graph = open_digraph.from_dot_file(source)
+
+        # The ids of the file are kept
+        self.assertEqual(graph.nodes, {5: node(5, 'In', {}, {7: 1}),
+                                       7: node(7, '&', {5: 1}, {9: 2}),
+                                       9: node(9, 'Out', {7: 2}, {})})
+        self.assertEqual(graph.add_node(), 0)
+        self.assertEqual(graph.add_node(), 1)
+
+        # Binary sources are read too
+        binary = open_digraph.from_dot_file(io.BytesIO(b'digraph { a -> b; b -> a }'))
+        self.assertEqual(binary.nodes, {'a': node('a', '', {'b': 1}, {'b': 1}),
+                                        'b': node('b', '', {'a': 1}, {'a': 1})})
+        with self.assertRaises(ValueError):
+            open_digraph.from_dot_file(io.StringIO('digraph { a -> @ }'))
+        # Subgraphs as edge ends are refused rather than read without their edges
+        for text in ('digraph { a -> {b c}; }', 'digraph { {b c} -> a; }', 'digraph { a -> ; }'):
+            with self.assertRaises(ValueError):
+                open_digraph.from_dot_file(io.StringIO(text))
+
+    def test_dot_round_trip(self):
+        graph = open_digraph([], [], [node(0, 'a "b"', {}, {1: 3}), node(1, '&', {0: 3}, {'x y': 1}),
+                                      node('x y', '', {1: 1}, {})])
+        text = graph.to_dot_string()
+        self.assertEqual(text.count('0 -> 1;'), 3)
+        self.assertEqual(open_digraph.from_dot_file(io.StringIO(text)).nodes, graph.nodes)
+
+        collapsed = graph.to_dot_string(collapse=True)
+        self.assertIn('0 -> 1 [multiplicity=3];', collapsed)
+        self.assertIn('1 -> "x y";', collapsed)
+        self.assertEqual(open_digraph.from_dot_file(io.StringIO(collapsed)).nodes, graph.nodes)
+
+        # Backslashes are escaped too, even before a quote or at the end of a label
+        escaped = open_digraph([], [], [node(0, 'x\\', {}, {1: 1}), node(1, 'a\\"b\\\\', {0: 1}, {})])
+        text = escaped.to_dot_string()
+        self.assertIn('[label="x\\\\"]', text)
+        self.assertEqual(open_digraph.from_dot_file(io.StringIO(text)).nodes, escaped.nodes)
+
+        # And newlines, since the reader goes line by line
+        multiline = open_digraph([], [], [node(0, 'x\ny', {}, {'a\nb': 1}), node('a\nb', '\\n', {0: 1}, {})])
+        text = multiline.to_dot_string()
+        self.assertIn('[label="x\\ny"]', text)
+        self.assertEqual(open_digraph.from_dot_file(io.StringIO(text)).nodes, multiline.nodes)
+
+        # Multiplicities are positive integers
+        for multiplicity in ('0', '-1', 'two', '1.5'):
+            with self.assertRaises(ValueError):
+                open_digraph.from_dot_file(io.StringIO(f'digraph {{ a -> b [multiplicity={multiplicity}]; }}'))
+
+        # Small chunks give the same text
+        stream = io.StringIO()
+        graph.write_dot(stream, verbose=True, chunk_size=1)
+        self.assertEqual(stream.getvalue(), graph.to_dot_string(verbose=True))
+        self.assertIn('[label="1: &"]', stream.getvalue())
+
     def test_display_graph(self):
         # Create an instance of the open_digraph class
         graph = open_digraph.random(n=10, bound=3, form="DAG")
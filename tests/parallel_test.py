@@ -0,0 +1,50 @@
+import sys
+import os
+root = os.path.expanduser('~/L2/ProjetInfo/Project-LDD2-S4')
+sys.path.append(root) # allows us to fetch files from the project root
+import pickle
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+from modules.open_digraph import *
+from modules.compact_digraph import *
+from modules.bool_circ import *
+from modules.parallel import *
+
+
+class ParallelTest(unittest.TestCase):
+
+    def test_pickle(self):
+        graph = open_digraph.random(20, 2, inputs=2, outputs=2, form="DAG", seed=0)
+        c = pickle.loads(pickle.dumps(compact_digraph.from_open_digraph(graph)))
+        self.assertEqual(c.to_open_digraph().nodes, graph.nodes)
+
+    def test_map_graphs(self):
+        graphs = [open_digraph.random(n, 2, form="DAG", seed=n) for n in range(1, 30)]
+        graphs[3].nodes[0].children[1] = 5 # Not well formed any more
+        expected = [g.is_well_formed() for g in graphs]
+        self.assertEqual(map_graphs(open_digraph.is_well_formed, graphs, workers=2, chunksize=4), expected)
+        self.assertEqual(map_graphs(compact_digraph.is_well_formed, graphs, workers=2, materialize=False),
+                         expected)
+        with ProcessPoolExecutor(2) as pool:
+            self.assertEqual(map_graphs(open_digraph.graph_depth, graphs[4:], executor=pool),
+                             [g.graph_depth() for g in graphs[4:]])
+
+    def test_map_components(self):
+        graph = open_digraph.random(5, 1, form="DAG", seed=1)
+        graph = graph.parallel(open_digraph.random(3, 1, form="DAG", seed=2))
+        self.assertEqual(map_components(len, graph, workers=2, materialize=False),
+                         [len(g.nodes) for g in graph.split_components()])
+
+    def test_map_batches(self):
+        graph = open_digraph([], [], [])
+        x, y = graph.add_node(''), graph.add_node('')
+        graph.add_input_node(x)
+        graph.add_input_node(y)
+        graph.add_output_node(graph.add_node('^', parents={x: 1, y: 1}))
+        batches = [([a, b], 8) for a in range(0, 256, 37) for b in range(0, 256, 51)]
+        self.assertEqual(map_batches(graph, batches, workers=2, chunksize=3),
+                         [[a ^ b] for (a, b), _ in batches])
+
+
+if __name__ == '__main__': # the following code is called only when
+    unittest.main() # precisely this file is run
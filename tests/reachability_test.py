@@ -0,0 +1,88 @@
+import sys
+import os
+root = os.path.expanduser('~/L2/ProjetInfo/Project-LDD2-S4')
+sys.path.append(root) # allows us to fetch files from the project root
+import random
+import unittest
+from modules.open_digraph import *
+from modules.reachability import *
+
+
+def descendants(graph, u):
+    # Reference answer: plain search over the children
+    found = {u}
+    stack = [u]
+    while stack:
+        for child_id in graph.nodes[stack.pop()].children:
+            if child_id not in found:
+                found.add(child_id)
+                stack.append(child_id)
+    return found
+
+
+class ReachabilityTest(unittest.TestCase):
+
+    def check(self, graph, index):
+        ids = list(graph.nodes)
+        reach = {u: descendants(graph, u) for u in ids}
+        for u in ids:
+            for v in ids:
+                self.assertEqual(index.reachable(u, v), v in reach[u], (u, v))
+        for u, v in zip(ids, reversed(ids)):
+            self.assertEqual(index.common_ancestors(u, v),
+                             {w for w in ids if u in reach[w] and v in reach[w]})
+
+    def test_reachable(self):
+        for seed in range(20):
+            graph = open_digraph.random(15, 2, inputs=2, outputs=2, form="DAG", seed=seed)
+            for method in ("bitset", "interval"):
+                self.check(graph, reachability_index(graph, method))
+
+    def test_errors(self):
+        graph = open_digraph.from_edge_list([(0, 1), (1, 0)])
+        self.assertRaises(ValueError, reachability_index, graph)
+        graph = open_digraph.from_edge_list([(0, 1)])
+        self.assertRaises(ValueError, reachability_index, graph, "matrix")
+        self.assertRaises(ValueError, graph.reachable, 0, 5)
+
+    def test_patching(self):
+        rng = random.Random(3)
+        graph = open_digraph.random(12, 1, form="DAG", seed=3)
+        index = graph.build_reachability_index()
+        for _ in range(30):
+            ids = list(graph.nodes)
+            u, v = rng.choice(ids), rng.choice(ids)
+            if u in descendants(graph, v):
+                u, v = v, u # Keep the graph acyclic
+            if rng.random() < 0.3:
+                graph.add_node('', parents={u: 1}, children={v: 1} if rng.random() < 0.5 else {})
+            elif u != v:
+                graph.add_edge(u, v)
+            self.assertIs(graph._reach, index)
+            self.check(graph, index)
+        # An edge closing a cycle drops the index
+        u = next(iter(graph.nodes))
+        graph.add_edge(max(descendants(graph, u)), u)
+        self.assertIsNone(graph._reach)
+
+        graph = open_digraph.from_edge_list([(0, 1), (1, 2)])
+        self.assertTrue(graph.reachable(0, 2))
+        graph.set_node_label(1, 'x')
+        self.assertIsNotNone(graph._reach)
+        graph.remove_edge(1, 2)
+        self.assertIsNone(graph._reach)
+        self.assertFalse(graph.reachable(0, 2))
+        self.assertEqual(graph.common_ancestors(1, 2), set())
+
+        # Isolated nodes added in bulk: patched by a bitset, an interval index is dropped
+        for method in ("bitset", "interval"):
+            graph = open_digraph.from_edge_list([(0, 1)])
+            graph.build_reachability_index(method)
+            new_ids = graph.add_nodes_bulk(['a', 'b'])
+            self.assertEqual(graph._reach is None, method == "interval")
+            self.assertFalse(graph.reachable(0, new_ids[0]))
+            self.assertTrue(graph.reachable(new_ids[1], new_ids[1]))
+
+
+if __name__ == '__main__': # the following code is called only when
+    unittest.main() # precisely this file is run
@@ -0,0 +1,27 @@
+import sys
+import os
+root = os.path.expanduser('~/L2/ProjetInfo/Project-LDD2-S4')
+sys.path.append(root) # allows us to fetch files from the project root
+import unittest
+from modules.union_find import *
+
+
+class UnionFindTest(unittest.TestCase):
+
+    def test_union_find(self):
+        sets = union_find(range(6))
+        sets.union(0, 1)
+        sets.union(2, 3)
+        sets.union(1, 3)
+        sets.add(6)
+        self.assertEqual(len({sets.find(i) for i in range(4)}), 1)
+        self.assertNotEqual(sets.find(4), sets.find(0))
+        self.assertEqual(sets.find(6), 6)
+        # Union by rank keeps the trees flat, path compression flattens them further
+        self.assertEqual(max(sets.rank.values()), 2)
+        sets.find(0)
+        self.assertTrue(all(sets.parent[i] == sets.find(0) for i in range(4)))
+
+
+if __name__ == '__main__': # the following code is called only when
+    unittest.main() # precisely this file is run